@@ -4,6 +4,10 @@ function md5(str) {
     // For production, use a proper library
     return CryptoJS ? CryptoJS.MD5(str).toString() : '';
 }
+const HISTORY_PAGE_SIZE = 30;
+const HISTORY_FIELDS = ['session_name', 'created_at', 'updated_at'];
+const MESSAGE_PAGE_SIZE = 50;
+
 class DocBotApp {
     constructor() {
         this.filesUploaded = false;
@@ -17,6 +21,8 @@ class DocBotApp {
         this._fileListHandlersBound = false; // avoid duplicate listeners
         this._startingNewChat = false; // guard to prevent duplicate session creation
         this._suppressSignInAutoOpen = true; // suppress first SIGNED_IN auto-open on initial load
+        this.historyCursor = null; // keyset cursor of the next page of chat history
+        this.messagesCursor = null; // keyset cursor of the messages before the loaded window
         this.initAuthAndApp();
     }
 
@@ -106,7 +112,11 @@ class DocBotApp {
         try {
             const lastId = localStorage.getItem('lastChatId');
             if (lastId && Array.isArray(chats) && chats.length > 0) {
-                const target = chats.find(c => String(c.id) === String(lastId));
+                let target = chats.find(c => String(c.id) === String(lastId));
+                if (!target) {
+                    // The last chat may be older than the first history page
+                    try { target = this.normalizeChat((await apiClient.getChatSession(lastId)).data); } catch {}
+                }
                 if (target) {
                     await this.loadChat(target);
                     const list = document.getElementById('historyList');
@@ -569,21 +579,35 @@ class DocBotApp {
             }
         } catch {}
         this.addMessage(message, 'user');
-        // Persist user message before processing
-        try { await apiClient.createChatMessage(this.currentChatId, 'user', message); } catch {}
+        // The server persists the user message while it embeds the query
         messageInput.value = '';
         messageInput.style.height = 'auto';
+        let thinking = null;
         try {
-            const thinking = this.addTypingIndicator();
-            const res = await apiClient.processMessage(this.currentChatId, message);
+            thinking = this.addTypingIndicator();
+            let botDiv = null;
+            let botEntry = null;
+            let streamed = '';
+            const res = await apiClient.processMessageStream(this.currentChatId, message, (delta) => {
+                streamed += delta;
+                if (!botDiv) {
+                    if (thinking && thinking.remove) thinking.remove();
+                    botDiv = this.addMessage(streamed, 'bot');
+                    botEntry = this.chatHistory[this.chatHistory.length - 1];
+                } else {
+                    this.updateBotMessage(botDiv, streamed, botEntry);
+                }
+            }, true);
             if (thinking && thinking.remove) thinking.remove();
-            const answer = res?.data?.answer || res?.answer || 'No answer';
-            this.addMessage(answer, 'bot');
+            const answer = res?.data?.answer || streamed || 'No answer';
+            if (botDiv) this.updateBotMessage(botDiv, answer, botEntry);
+            else this.addMessage(answer, 'bot');
             const copyLastBtnRef = document.getElementById('copyLastBtn');
             if (copyLastBtnRef) copyLastBtnRef.disabled = false;
             const regenBtnRef = document.getElementById('regenBtn');
             if (regenBtnRef) regenBtnRef.disabled = false;
         } catch (e) {
+            if (thinking && thinking.remove) thinking.remove();
             this.addMessage(`Error: ${e.message || e}`, 'bot');
         }
     }
@@ -646,7 +670,7 @@ class DocBotApp {
         return s;
     }
 
-    addMessage(message, sender) {
+    addMessage(message, sender, options = {}) {
         const chatMessages = document.getElementById('chatMessages');
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${sender}`;
@@ -688,9 +712,26 @@ class DocBotApp {
         content.appendChild(time);
         messageDiv.appendChild(avatar);
         messageDiv.appendChild(content);
+        if (options.before) {
+            // Older messages loaded above the current window
+            chatMessages.insertBefore(messageDiv, options.before);
+            this.chatHistory.splice(options.historyIndex || 0, 0, { sender, message, at: options.at || Date.now() });
+            return messageDiv;
+        }
         chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
-        this.chatHistory.push({ sender, message, at: Date.now() });
+        this.chatHistory.push({ sender, message, at: options.at || Date.now() });
+        return messageDiv;
+    }
+
+    updateBotMessage(messageDiv, message, historyEntry) {
+        const content = messageDiv.querySelector('.message-content');
+        const time = content.querySelector('.message-time');
+        content.innerHTML = this.formatBotAnswer(message);
+        if (time) content.appendChild(time);
+        if (historyEntry) historyEntry.message = message;
+        const chatMessages = document.getElementById('chatMessages');
+        chatMessages.scrollTop = chatMessages.scrollHeight;
     }
 
     addTypingIndicator() {
@@ -845,6 +886,7 @@ class DocBotApp {
         });
     
         this.chatHistory = [];
+        this.messagesCursor = null;
     
         const copyLastBtn = document.getElementById('copyLastBtn');
         if (copyLastBtn) copyLastBtn.disabled = true;
@@ -962,21 +1004,11 @@ class DocBotApp {
     async loadChatHistory() {
         if (!this.authManager || !this.chatStorage || !this.authManager.canSaveChat()) return;
 
-        const result = await this.chatStorage.getChats();
+        const result = await this.chatStorage.getChats({ limit: HISTORY_PAGE_SIZE, fields: HISTORY_FIELDS });
         if (result.success) {
-            // Normalize to expected shape
-            const chats = (result.data || []).map(s => ({
-                id: s.id,
-                title: s.session_name || s.title || 'New Chat',
-                created_at: s.created_at,
-                updated_at: s.updated_at,
-            }));
-            // Sort by updated_at desc, fallback to created_at
-            chats.sort((a, b) => {
-                const ta = new Date(a.updated_at || a.created_at || 0).getTime();
-                const tb = new Date(b.updated_at || b.created_at || 0).getTime();
-                return tb - ta;
-            });
+            // Server returns the most recently updated first
+            const chats = (result.data || []).map(s => this.normalizeChat(s));
+            this.historyCursor = result.nextCursor || null;
             this.refreshHistoryList(chats);
             // Keep current chat highlighted after reload
             if (this.currentChatId) {
@@ -992,11 +1024,34 @@ class DocBotApp {
         return [];
     }
 
-    refreshHistoryList(chats = []) {
+    normalizeChat(s) {
+        return {
+            id: s.id,
+            title: s.session_name || s.title || 'New Chat',
+            created_at: s.created_at,
+            updated_at: s.updated_at,
+        };
+    }
+
+    async loadMoreChatHistory() {
+        if (!this.historyCursor || !this.chatStorage) return;
+        const result = await this.chatStorage.getChats({ limit: HISTORY_PAGE_SIZE, cursor: this.historyCursor, fields: HISTORY_FIELDS });
+        if (!result.success) return;
+        this.historyCursor = result.nextCursor || null;
+        this.refreshHistoryList((result.data || []).map(s => this.normalizeChat(s)), { append: true });
+        if (this.currentChatId) {
+            const li = document.querySelector(`#historyList li[data-id="${this.currentChatId}"]`);
+            if (li) li.classList.add('active');
+        }
+    }
+
+    refreshHistoryList(chats = [], { append = false } = {}) {
         const list = document.getElementById('historyList');
         if (!list) return;
         
-        list.innerHTML = '';
+        const loadMore = list.querySelector('li.history-load-more');
+        if (loadMore) loadMore.remove();
+        if (!append) list.innerHTML = '';
         chats.forEach((chat) => {
             const li = document.createElement('li');
             li.dataset.id = chat.id;
@@ -1017,6 +1072,13 @@ class DocBotApp {
             });
             list.appendChild(li);
         });
+        if (this.historyCursor) {
+            const more = document.createElement('li');
+            more.className = 'history-load-more';
+            more.textContent = 'Load more';
+            more.addEventListener('click', () => this.loadMoreChatHistory());
+            list.appendChild(more);
+        }
     }
 
     renameChatInline(chatId) {
@@ -1131,17 +1193,15 @@ class DocBotApp {
         // Load messages from server
         let msgs = [];
         try {
-            const msgRes = await apiClient.getChatMessages(chat.id);
+            // Only the latest window; older messages are fetched on demand
+            const msgRes = await apiClient.getChatMessagesPage(chat.id, { limit: MESSAGE_PAGE_SIZE });
             msgs = msgRes.data || [];
-            msgs.sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
             msgs.forEach(m => {
                 const sender = m.role === 'user' ? 'user' : 'bot';
-                const contentText = m.message || m.content || '';
-                const msg = { sender, message: contentText, at: new Date(m.created_at).getTime() };
-                this.addMessage(msg.message, msg.sender);
-                // Replace last pushed timestamp with actual
-                this.chatHistory[this.chatHistory.length - 1].at = msg.at;
+                this.addMessage(m.message || m.content || '', sender, { at: new Date(m.created_at).getTime() });
             });
+            this.messagesCursor = msgRes.nextCursor || null;
+            this.renderLoadEarlierButton();
         } catch {}
         chatMessages.scrollTop = chatMessages.scrollHeight;
         
@@ -1151,12 +1211,55 @@ class DocBotApp {
         if (regenBtn) regenBtn.disabled = !this.chatHistory.some(x => x.sender === 'user');
 
         // Decide if we should auto-rename on first user message for this chat
-        const hasUserMsg = Array.isArray(msgs) && msgs.some(m => (m.role === 'user' || m.sender === 'user'));
+        const hasUserMsg = !!this.messagesCursor || (Array.isArray(msgs) && msgs.some(m => (m.role === 'user' || m.sender === 'user')));
         const isDefaultTitle = ((chat.title || '').trim().toLowerCase() === 'new chat');
         // If there's already any user message, or the title is not the default, consider it already renamed
         this.firstUserMessageRenamed = hasUserMsg || !isDefaultTitle ? true : false;
     }
 
+    renderLoadEarlierButton() {
+        const chatMessages = document.getElementById('chatMessages');
+        let btn = document.getElementById('loadEarlierBtn');
+        if (!this.messagesCursor) {
+            if (btn) btn.remove();
+            return;
+        }
+        if (!btn) {
+            btn = document.createElement('button');
+            btn.id = 'loadEarlierBtn';
+            btn.className = 'load-earlier-btn';
+            btn.textContent = 'Load earlier messages';
+            btn.addEventListener('click', () => this.loadEarlierMessages());
+        }
+        const firstMessage = chatMessages.querySelector('.message');
+        if (firstMessage) chatMessages.insertBefore(btn, firstMessage);
+        else chatMessages.appendChild(btn);
+    }
+
+    async loadEarlierMessages() {
+        if (!this.currentChatId || !this.messagesCursor) return;
+        const chatId = this.currentChatId;
+        const chatMessages = document.getElementById('chatMessages');
+        let res;
+        try {
+            res = await apiClient.getChatMessagesPage(chatId, { limit: MESSAGE_PAGE_SIZE, cursor: this.messagesCursor });
+        } catch (e) {
+            console.warn('Loading earlier messages failed:', e);
+            return;
+        }
+        if (chatId !== this.currentChatId) return;
+        const anchor = chatMessages.querySelector('.message');
+        const previousHeight = chatMessages.scrollHeight;
+        (res.data || []).forEach((m, i) => {
+            const sender = m.role === 'user' ? 'user' : 'bot';
+            this.addMessage(m.message || m.content || '', sender, { before: anchor, historyIndex: i, at: new Date(m.created_at).getTime() });
+        });
+        this.messagesCursor = res.nextCursor || null;
+        this.renderLoadEarlierButton();
+        // Keep the messages the user was reading in place
+        chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+    }
+
     async renameChat(chatId, currentTitle) { this.renameChatInline(chatId); }
 
     async deleteChat(chatId) {
@@ -67,9 +67,23 @@ class APIClient {
     getUserInfo() { return this.request('/user/profile'); }
 
     // Chat APIs mapped to server
-    async listUserChats() {
-        const data = await this.request('/chat/user/');
-        return { success: true, data };
+    // Without a page, the full list (legacy shape). With { limit, cursor, fields }, one keyset page:
+    // data holds the page and nextCursor is passed back to get the following one (null at the end).
+    async listUserChats(page = null) {
+        if (!page) {
+            const data = await this.request('/chat/user/');
+            return { success: true, data };
+        }
+        const data = await this.request(`/chat/user/?${this.pageQuery(page)}`);
+        return { success: true, data: data.items, nextCursor: data.next_cursor };
+    }
+
+    pageQuery({ limit, cursor, fields } = {}) {
+        const params = new URLSearchParams();
+        if (limit) params.set('limit', String(limit));
+        if (cursor) params.set('cursor', cursor);
+        if (fields) params.set('fields', Array.isArray(fields) ? fields.join(',') : fields);
+        return params.toString();
     }
 
     async createChat(title = 'New Chat') {
@@ -87,6 +101,12 @@ class APIClient {
         return { success: true, data };
     }
 
+    // Latest messages first page, then older ones via nextCursor; each page is in chronological order.
+    async getChatMessagesPage(chatId, page = {}) {
+        const data = await this.request(`/chat/session/${chatId}/messages?${this.pageQuery({ limit: 50, ...page })}`);
+        return { success: true, data: data.items, nextCursor: data.next_cursor };
+    }
+
     async getChatFiles(chatId) {
         const data = await this.request(`/chat/session/${chatId}/files`);
         return { success: true, data };
@@ -100,8 +120,27 @@ class APIClient {
     async uploadFileToSession(sessionId, file) {
         const form = new FormData();
         form.append('file', file, file.name);
-        const data = await this.requestForm(`/chat/session/${sessionId}/upload`, form);
-        return { success: true, data };
+        const job = await this.requestForm(`/chat/session/${sessionId}/upload`, form);
+        // Indexing runs in a background job; wait for it so callers still get the file record.
+        // Serverless deployments index inline and answer with the finished job, which is never polled.
+        const done = await this.waitForUploadJob(job.id, null, 1000, job);
+        return { success: true, data: done.result };
+    }
+
+    async getUploadJob(jobId) {
+        return await this.request(`/chat/jobs/${jobId}`);
+    }
+
+    async waitForUploadJob(jobId, onProgress = null, intervalMs = 1000, knownJob = null) {
+        let job = knownJob;
+        while (true) {
+            if (!job || (job.status !== 'succeeded' && job.status !== 'failed')) job = await this.getUploadJob(jobId);
+            if (onProgress) onProgress(job);
+            if (job.status === 'succeeded') return job;
+            if (job.status === 'failed') throw new Error(job.error || 'Upload failed');
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+            job = null;
+        }
     }
 
     async createChatMessage(chatId, role, content) {
@@ -109,11 +148,60 @@ class APIClient {
         return { success: true, data };
     }
 
-    async processMessage(chatId, userMessage) {
-        const data = await this.request(`/chat/session/${chatId}/process`, { method: 'POST', body: JSON.stringify({ user_message: userMessage }) });
+    async processMessage(chatId, userMessage, saveUserMessage = false) {
+        const data = await this.request(`/chat/session/${chatId}/process`, { method: 'POST', body: JSON.stringify({ user_message: userMessage, save_user_message: saveUserMessage }) });
         return { success: true, data };
     }
 
+    // Streams the answer as server-sent events; onDelta receives each text fragment as it arrives.
+    async processMessageStream(chatId, userMessage, onDelta, saveUserMessage = false) {
+        const url = `${this.baseURL}/chat/session/${chatId}/process/stream`;
+        const config = {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+            credentials: 'include',
+            body: JSON.stringify({ user_message: userMessage, save_user_message: saveUserMessage })
+        };
+        let response = await fetch(url, config);
+        if (response.status === 401) {
+            try {
+                await this.refreshAccessToken({ skipAuthRefresh: true });
+                response = await fetch(url, config);
+            } catch (e) {}
+        }
+        if (!response.ok || !response.body) {
+            let errorMessage = 'Request failed';
+            try { const errorData = await response.json(); errorMessage = errorData.detail || errorData.error || errorMessage; } catch {}
+            throw new Error(errorMessage);
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (!data) continue;
+                const payload = JSON.parse(data);
+                if (event === 'delta' && onDelta) onDelta(payload.content || '');
+                else if (event === 'done') result = payload;
+                else if (event === 'error') throw new Error(payload.detail || 'Streaming failed');
+            }
+        }
+        return { success: true, data: result };
+    }
+
     async renameChat(chatId, newName) {
         const data = await this.request(`/chat/session/${chatId}/rename`, { method: 'PUT', body: JSON.stringify({ new_name: newName }) });
         return { success: true, data };
@@ -124,6 +212,12 @@ class APIClient {
         return { success: true };
     }
 
+    // Deletes many sessions in one request; returns the ids the server actually deleted.
+    async deleteChats(chatIds) {
+        const result = await this.request('/chat/sessions/bulk-delete', { method: 'POST', body: JSON.stringify({ session_ids: chatIds }) });
+        return { success: true, deleted: result?.deleted || [] };
+    }
+
     async deleteFile(fileId) {
         await this.request(`/chat/file/${fileId}`, { method: 'DELETE' });
         return { success: true };
@@ -225,9 +319,9 @@ class ChatStorage {
         return { success: true, data: session };
     }
 
-    async getChats() {
+    async getChats(page = null) {
         if (!this.authManager.canSaveChat()) return { success: false, error: 'Please sign in to view chat history' };
-        return await apiClient.listUserChats();
+        return await apiClient.listUserChats(page);
     }
 
     async updateChatTitle(chatId, newTitle) {
@@ -6,12 +6,22 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from routes.user_route import router as user_router
 from routes.chat_route import router as chat_router
+from controllers import chat_controller
 
-app = FastAPI(title="Doc Chat App API", version="1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the embedder in the background so startup never waits on the model or the remote space.
+    chat_controller.start_embedding_warmup()
+    yield
+    chat_controller.shutdown()
+
+app = FastAPI(title="Doc Chat App API", version="1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,4 +40,9 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"ok": True}
\ No newline at end of file
+    return {"ok": True}
+
+@app.get("/ready")
+def ready():
+    readiness = chat_controller.get_readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ok"] else 503)
\ No newline at end of file
@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+import json
+import argparse
+import random
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# The client is replaced by an in-memory table below; it only needs to construct.
+os.environ.setdefault("SUPABASE_URL", "https://benchmark.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+import models.chat_model as chat_model
+
+
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    # Just enough of the PostgREST builder: filters run "server side", and returned rows pay a JSON round trip
+    # so the client cost grows with the rows transferred, as it does over the network.
+    def __init__(self, db, table):
+        self.db = db
+        self.rows = db.tables[table]
+        self.columns = None
+        self.count = None
+
+    def select(self, columns, count=None):
+        self.columns = None if columns == "*" else [c.strip() for c in columns.split(",")]
+        self.count = count
+        return self
+
+    def eq(self, column, value):
+        self.rows = [r for r in self.rows if r[column] == value]
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.rows = [r for r in self.rows if r[column] in values]
+        return self
+
+    def filter(self, column, operator, value):
+        assert operator == "not.in"
+        excluded = {int(v) for v in value.strip("()").split(",") if v}
+        self.rows = [r for r in self.rows if r[column] not in excluded]
+        return self
+
+    def execute(self):
+        rows = self.rows if self.columns is None else [{c: r[c] for c in self.columns} for r in self.rows]
+        payload = json.dumps(rows)
+        self.db.rows_transferred += len(rows)
+        self.db.bytes_transferred += len(payload)
+        return _Response(json.loads(payload), len(rows) if self.count else None)
+
+
+class FakeSupabase:
+    def __init__(self, users: int, sessions_per_user: int, files_per_session: int, seed: int = 0):
+        rng = random.Random(seed)
+        sessions, links = [], []
+        for user_id in range(1, users + 1):
+            for _ in range(sessions_per_user):
+                session_id = len(sessions) + 1
+                sessions.append({"id": session_id, "user_id": user_id, "session_name": "New Chat"})
+                # Most sessions have files; a few are still empty.
+                if rng.random() < 0.9:
+                    for _ in range(files_per_session):
+                        links.append({"id": len(links) + 1, "session_id": session_id, "file_id": len(links) + 1})
+        self.tables = {"chat_sessions": sessions, "session_files": links}
+        self.rows_transferred = 0
+        self.bytes_transferred = 0
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+def legacy_count(user_id: int) -> int:
+    # The previous implementation: every link in the system, then a not.in filter built from all of them.
+    supabase = chat_model.supabase
+    session_files = supabase.table("session_files").select("session_id").execute().data
+    session_ids = [s["session_id"] for s in session_files] if session_files else []
+    query = supabase.table("chat_sessions").select("id", count="exact").eq("user_id", user_id)
+    if session_ids:
+        ids_str = "(" + ",".join(map(str, session_ids)) + ")"
+        query = query.filter("id", "not.in", ids_str)
+    return query.execute().count
+
+
+def legacy_get(user_id: int):
+    supabase = chat_model.supabase
+    all_sessions = supabase.table("chat_sessions").select("*").eq("user_id", user_id).execute()
+    if not all_sessions.data:
+        return None
+    linked_sessions = supabase.table("session_files").select("session_id").execute().data
+    linked_ids = {s["session_id"] for s in linked_sessions} if linked_sessions else set()
+    for session in all_sessions.data:
+        if session["id"] not in linked_ids:
+            return session
+    return None
+
+
+def legacy_new_chat(user_id: int):
+    if legacy_count(user_id) > 0:
+        return legacy_get(user_id)
+    return None
+
+
+def scoped_new_chat(user_id: int):
+    return chat_model.get_chat_session_not_have_file(user_id)
+
+
+def measure(fn, db: FakeSupabase, user_id: int, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        db.rows_transferred = db.bytes_transferred = 0
+        start = time.perf_counter()
+        result = fn(user_id)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, db.rows_transferred, db.bytes_transferred, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the global and user-scoped empty-session lookups behind New Chat")
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--sessions-per-user", type=int, default=20)
+    parser.add_argument("--files-per-session", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'users':>7} {'links':>8} {'legacy ms':>10} {'legacy rows':>12} {'scoped ms':>10} {'scoped rows':>12}")
+    for users in args.users:
+        db = FakeSupabase(users, args.sessions_per_user, args.files_per_session)
+        chat_model.supabase = db
+        user_id = users // 2 or 1
+        legacy_ms, legacy_rows, _, legacy_result = measure(legacy_new_chat, db, user_id, args.repeat)
+        scoped_ms, scoped_rows, _, scoped_result = measure(scoped_new_chat, db, user_id, args.repeat)
+        assert (legacy_result or {}).get("id") == (scoped_result or {}).get("id"), "implementations disagree"
+        links = len(db.tables["session_files"])
+        print(f"{users:>7} {links:>8} {legacy_ms:>10.2f} {legacy_rows:>12} {scoped_ms:>10.2f} {scoped_rows:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from services.vector_index import ExactIndex, normalize_rows
+
+
+def legacy_search(embeddings: np.ndarray, query_embedding: np.ndarray, top_k: int):
+    # The pre-index implementation of search_similar_chunks: normalise everything, full argsort.
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    query_vec = query_embedding / np.linalg.norm(query_embedding)
+    similarities = np.dot(embeddings, query_vec)
+    top_indices = np.argsort(similarities)[::-1][:top_k]
+    return similarities[top_indices], top_indices
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare legacy argsort scoring with the argpartition top-k engine")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>8} {'legacy ms':>10} {'topk ms':>9} {'loop x' + str(args.queries) + ' ms':>14} {'batch x' + str(args.queries) + ' ms':>15}")
+    for size in args.sizes:
+        raw = rng.standard_normal((size, args.dim)).astype(np.float32)
+        queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+        index = ExactIndex(normalize_rows(raw))
+        normalized_queries = normalize_rows(queries)
+
+        legacy_ids = legacy_search(raw, queries[0], args.top_k)[1]
+        new_ids = index.search(normalized_queries[0], args.top_k)[1]
+        assert list(legacy_ids) == list(new_ids), "top-k mismatch between implementations"
+
+        legacy_ms = best_of(lambda: legacy_search(raw, queries[0], args.top_k), args.repeat)
+        topk_ms = best_of(lambda: index.search(normalized_queries[0], args.top_k), args.repeat)
+        loop_ms = best_of(lambda: [legacy_search(raw, q, args.top_k) for q in queries], args.repeat)
+        batch_ms = best_of(lambda: index.search_batch(normalized_queries, args.top_k), args.repeat)
+        print(f"{size:>8} {legacy_ms:>10.2f} {topk_ms:>9.2f} {loop_ms:>14.2f} {batch_ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import zlib
+import asyncio
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# Database, retrieval and LLM calls are replaced below; the client only needs to construct.
+os.environ.setdefault("SUPABASE_URL", "https://benchmark.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+import numpy as np
+import services.answer_cache as answer_cache
+import services.chat_service as chat_service
+
+_messages = []
+_llm_calls = []
+
+
+async def _recent_messages(session_id: int, limit: int):
+    return [m for m in _messages if m["session_id"] == session_id][-limit:]
+
+
+async def _save_message(session_id: int, role: str, content: str):
+    row = {"id": len(_messages) + 1, "session_id": session_id, "role": role, "message": content}
+    _messages.append(row)
+    return row
+
+
+async def _retrieve_context(session_id: int, message: str, save_user_message: bool = False):
+    if save_user_message:
+        await chat_service._save_message(session_id, "user", message)
+    # One vector per distinct question (so unrelated questions are not paraphrases) and the same chunks for all.
+    rng = np.random.default_rng(zlib.crc32(answer_cache.normalize_question(message).encode("utf-8")))
+    return rng.standard_normal(8).astype(np.float32), [{"id": 1, "file_name": "handbook.pdf", "text": "Refunds take 14 days."}]
+
+
+async def _call_llm(prompt: str) -> str:
+    _llm_calls.append(prompt)
+    return f"answer {len(_llm_calls)}"
+
+
+def _install_stubs():
+    chat_service.chat_model.get_recent_messages_async = _recent_messages
+    chat_service.chat_model.create_chat_message_async = _save_message
+    chat_service.retrieve_context = _retrieve_context
+    chat_service.call_llm_api = _call_llm
+
+
+async def _ask(session_id: int, question: str) -> bool:
+    result = await chat_service.process_user_message(session_id, question, save_user_message=True)
+    return result["cached"]
+
+
+async def run(repeat: int):
+    # A standalone question asked again later in the same session is served from the cache, although the
+    # conversation window in the prompt changed in between.
+    standalone = "How long does a refund take in the handbook policy?"
+    cached = [await _ask(1, standalone) for _ in range(repeat)]
+    print(f"standalone question x{repeat}: cached={cached}")
+    assert cached == [False] + [True] * (repeat - 1), "repeated standalone question missed the answer cache"
+
+    # A follow-up depends on what came before: after a different exchange it is answered again.
+    follow_up = "And what about the exceptions to it?"
+    first = await _ask(2, follow_up)
+    await _ask(2, "Who approves expense reports in the finance policy?")
+    second = await _ask(2, follow_up)
+    print(f"follow-up after a different exchange: cached={[first, second]}")
+    assert not first and not second, "follow-up reused an answer given for another conversation"
+
+    stats = answer_cache.stats()
+    print(f"answer cache hits={stats['hits']} misses={stats['misses']} llm calls={len(_llm_calls)}")
+    assert stats["hits"] >= repeat - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the answer cache still serves repeated standalone questions")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    _install_stubs()
+    asyncio.run(run(max(2, args.repeat)))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, AsyncIterator
 from fastapi import UploadFile
 import services.chat_service as chat_service
 
@@ -15,6 +15,14 @@ def get_chat_messages(session_id: int) -> list:
     return chat_service.get_messages_by_chat_session_id(session_id)
 
 
+def get_chat_sessions_page(user_id: int, limit: Optional[int], cursor: Optional[str], fields: Optional[str]) -> Dict:
+    return chat_service.get_chat_sessions_page(user_id, limit, cursor, fields)
+
+
+def get_chat_messages_page(session_id: int, limit: Optional[int], cursor: Optional[str], fields: Optional[str]) -> Dict:
+    return chat_service.get_messages_page(session_id, limit, cursor, fields)
+
+
 def get_file(file_id: int) -> Dict:
     return chat_service.get_file_info_by_id(file_id)
 
@@ -39,12 +47,37 @@ def delete_chat_session(session_id: int) -> bool:
     return chat_service.delete_chat_session_by_id(session_id)
 
 
+def delete_chat_sessions(user_id: int, session_ids: List[int]) -> Dict:
+    return chat_service.delete_chat_sessions_by_ids(user_id, session_ids)
+
+
 def delete_file(file_id: int) -> bool:
     return chat_service.delete_file_from_session(file_id)
 
 
-def process_user_message(session_id: int, user_message: str) -> Dict:
-    return chat_service.process_user_message(session_id, user_message)
+async def process_user_message(session_id: int, user_message: str, save_user_message: bool = False) -> Dict:
+    return await chat_service.process_user_message(session_id, user_message, save_user_message)
+
+async def stream_user_message(session_id: int, user_message: str, save_user_message: bool = False) -> AsyncIterator[str]:
+    return await chat_service.stream_user_message(session_id, user_message, save_user_message)
+
+def get_readiness() -> Dict:
+    return chat_service.get_readiness()
+
+def start_embedding_warmup():
+    chat_service.start_embedding_warmup()
+
+def shutdown():
+    chat_service.shutdown()
+
+def get_metrics() -> Dict:
+    return chat_service.get_metrics()
 
 def upload_file(user_id: int, session_id: int, file: UploadFile) -> Dict:
     return chat_service.upload_file(user_id, session_id, file)
+
+def get_upload_job(job_id: str, user_id: int) -> Dict:
+    return chat_service.get_ingestion_job(job_id, user_id)
+
+def get_upload_jobs(user_id: int, session_id: Optional[int] = None) -> List[Dict]:
+    return chat_service.get_ingestion_jobs(user_id, session_id)
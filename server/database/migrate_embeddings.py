@@ -0,0 +1,44 @@
+import os
+import sys
+import argparse
+
+# Run from anywhere: make the server package modules importable like app.py does.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import models.chat_model as chat_model
+import services.embedding_codec as embedding_codec
+
+
+def migrate(batch_size: int, dtype: str, drop_legacy: bool) -> int:
+    migrated = 0
+    while True:
+        rows = chat_model.get_legacy_file_chunks(limit=batch_size)
+        if not rows:
+            break
+        progressed = False
+        for row in rows:
+            vec = embedding_codec.decode_embedding(row)
+            if vec is None:
+                continue
+            updates = embedding_codec.encode_embedding(vec, dtype=dtype)
+            updates.pop("embedding", None)
+            if drop_legacy:
+                updates["embedding"] = None
+            if chat_model.update_file_chunk(row["id"], updates):
+                migrated += 1
+                progressed = True
+        print(f"Migrated {migrated} chunks")
+        if not progressed:
+            break
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill file_chunks.embedding_b64 from the legacy vector column")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dtype", choices=["float32", "float16", "int8"], default=embedding_codec.EMBEDDING_STORAGE_DTYPE)
+    parser.add_argument("--drop-legacy", action="store_true", help="Clear the pgvector column after encoding")
+    args = parser.parse_args()
+    migrate(args.batch_size, args.dtype, args.drop_legacy)
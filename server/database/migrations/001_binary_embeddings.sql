@@ -0,0 +1,8 @@
+-- Store chunk embeddings as base64-encoded binary instead of text-serialised vectors.
+-- Existing rows keep their pgvector value until database/migrate_embeddings.py backfills them.
+ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS embedding_b64 TEXT;
+ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS embedding_dtype VARCHAR(16);
+ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS embedding_scale REAL;
+
+CREATE INDEX IF NOT EXISTS idx_file_chunks_embedding_b64_missing
+    ON file_chunks(id) WHERE embedding_b64 IS NULL;
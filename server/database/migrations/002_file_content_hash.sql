@@ -0,0 +1,6 @@
+-- Content-addressed ingestion: identical uploads reuse the chunks and vectors of an already indexed file.
+-- embedding_model is set only after every chunk of the file has been embedded and stored.
+ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE files ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(255);
+
+CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash, embedding_model);
@@ -0,0 +1,3 @@
+-- Page range of each chunk, filled in by the streaming chunker (PDF pages; 1 for files without pages).
+ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS page_start INT;
+ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS page_end INT;
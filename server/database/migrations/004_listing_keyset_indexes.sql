@@ -0,0 +1,3 @@
+-- Keyset pagination of session and message listings: each page is an index range scan on (owner, time, id).
+CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON chat_sessions(user_id, updated_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_session_created ON chat_messages(session_id, created_at DESC, id DESC);
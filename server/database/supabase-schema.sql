@@ -41,6 +41,8 @@ CREATE TABLE IF NOT EXISTS files (
     file_url TEXT NOT NULL,
     file_type VARCHAR(50) NOT NULL,
     file_size BIGINT,
+    content_hash VARCHAR(64), -- sha256 của nội dung file, dùng để tái sử dụng chunk/embedding
+    embedding_model VARCHAR(255), -- chỉ được gán khi toàn bộ chunk đã được embed
     uploaded_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
@@ -86,9 +88,14 @@ CREATE TABLE IF NOT EXISTS file_chunks (
     file_id INT NOT NULL REFERENCES files(id) ON DELETE CASCADE,
     chunk_index INT NOT NULL,
     text TEXT NOT NULL,
-    embedding vector(384), -- embedding 384 chiều
+    embedding vector(384), -- embedding 384 chiều (legacy, xem embedding_b64)
+    embedding_b64 TEXT, -- embedding nhị phân (float32/float16/int8) mã hoá base64
+    embedding_dtype VARCHAR(16),
+    embedding_scale REAL, -- hệ số scale cho int8
     embedding_model VARCHAR(255) DEFAULT 'all-MiniLM-L6-v2',
     chunk_size INT,
+    page_start INT, -- trang đầu tiên của chunk (PDF); NULL với file không có trang
+    page_end INT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(session_id, file_id, chunk_index)
 );
@@ -98,10 +105,13 @@ CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens(user_id)
 CREATE INDEX IF NOT EXISTS idx_otp_codes_user_id ON otp_codes(user_id);
 CREATE INDEX IF NOT EXISTS idx_otp_codes_code ON otp_codes(otp_code);
 CREATE INDEX IF NOT EXISTS idx_files_user_id ON files(user_id);
+CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash, embedding_model);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON chat_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON chat_sessions(user_id, updated_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_session_files_session_id ON session_files(session_id);
 CREATE INDEX IF NOT EXISTS idx_session_files_file_id ON session_files(file_id);
 CREATE INDEX IF NOT EXISTS idx_messages_session_id ON chat_messages(session_id);
+CREATE INDEX IF NOT EXISTS idx_messages_session_created ON chat_messages(session_id, created_at DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_file_chunks_session_id ON file_chunks(session_id);
 CREATE INDEX IF NOT EXISTS idx_file_chunks_file_id ON file_chunks(file_id);
 CREATE INDEX IF NOT EXISTS idx_file_chunks_session_chunk ON file_chunks(session_id, chunk_index);
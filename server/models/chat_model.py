@@ -1,13 +1,24 @@
-from .client_supabase import supabase
+from .client_supabase import supabase, get_async_supabase
 from datetime import datetime, timezone
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, Iterable, Iterator, Callable
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import dotenv
 from fastapi import UploadFile
 import os
+import json
+import time
 import uuid
+from urllib.parse import unquote
 
 dotenv.load_dotenv()
 BUCKET_NAME = os.getenv("SUPABASE_BUCKET", "uploads")
+DELETE_BATCH_SIZE = 500
+CHUNK_INSERT_BATCH_ROWS = int(os.getenv("CHUNK_INSERT_BATCH_ROWS", 200))
+CHUNK_INSERT_BATCH_BYTES = int(os.getenv("CHUNK_INSERT_BATCH_BYTES", 1024 * 1024))
+CHUNK_INSERT_CONCURRENCY = int(os.getenv("CHUNK_INSERT_CONCURRENCY", 4))
+CHUNK_INSERT_RETRIES = int(os.getenv("CHUNK_INSERT_RETRIES", 3))
+_chunk_insert_executor = ThreadPoolExecutor(max_workers=CHUNK_INSERT_CONCURRENCY, thread_name_prefix="chunk-insert")
 
 
 def get_chat_by_id(chat_id: int) -> Optional[Dict]:
@@ -25,6 +36,31 @@ def get_messages_by_session_id(session_id: int) -> Optional[List[Dict]]:
     return response.data if response.data else None
 
 
+def _keyset_page(query, time_column: str, limit: int, cursor: Optional[Tuple[datetime, int]], descending: bool) -> List[Dict]:
+    # Seeks past the cursor on (time_column, id) instead of OFFSET, so every page costs the same however deep it is.
+    # One extra row is fetched to tell the caller whether another page follows.
+    if cursor is not None:
+        op = "lt" if descending else "gt"
+        cursor_time, cursor_id = cursor[0].isoformat(), int(cursor[1])
+        query = query.or_(f'{time_column}.{op}."{cursor_time}",and({time_column}.eq."{cursor_time}",id.{op}.{cursor_id})')
+    response = query.order(time_column, desc=descending).order("id", desc=descending).limit(limit + 1).execute()
+    return response.data or []
+
+
+def get_chat_sessions_page(user_id: int, limit: int, cursor: Optional[Tuple[datetime, int]] = None,
+                           columns: str = "*") -> List[Dict]:
+    # Most recently updated first.
+    query = supabase.table("chat_sessions").select(columns).eq("user_id", user_id)
+    return _keyset_page(query, "updated_at", limit, cursor, descending=True)
+
+
+def get_messages_page(session_id: int, limit: int, cursor: Optional[Tuple[datetime, int]] = None,
+                      columns: str = "*") -> List[Dict]:
+    # Newest first, so the first page is the end of the conversation and cursors walk back in time.
+    query = supabase.table("chat_messages").select(columns).eq("session_id", session_id)
+    return _keyset_page(query, "created_at", limit, cursor, descending=True)
+
+
 def get_file_by_id(file_id: int) -> Optional[Dict]:
     response = supabase.table("files").select("*").eq("id", file_id).execute()
     return response.data[0] if response.data else None
@@ -35,6 +71,11 @@ def get_files_by_session_id(session_id: int) -> Optional[List[Dict]]:
     return response.data if response.data else None
 
 
+def get_session_ids_by_file_id(file_id: int) -> List[int]:
+    response = supabase.table("session_files").select("session_id").eq("file_id", file_id).execute()
+    return [row["session_id"] for row in response.data] if response.data else []
+
+
 def get_chat_sessions_by_user_id(user_id: int) -> Optional[List[Dict]]:
     response = supabase.table("chat_sessions").select("*").eq("user_id", user_id).execute()
     return response.data if response.data else None
@@ -67,6 +108,30 @@ def create_chat_message(session_id: int, role: str, content: str) -> Optional[Di
     return None
 
 
+async def create_chat_message_async(session_id: int, role: str, content: str) -> Optional[Dict]:
+    client = await get_async_supabase()
+    now = datetime.now(timezone.utc).isoformat()
+    new_message = {
+        "session_id": session_id,
+        "role": role,
+        "message": content,
+        "created_at": now,
+    }
+    response = await client.table("chat_messages").insert(new_message).execute()
+    if response.data:
+        await client.table("chat_sessions").update({"updated_at": now}).eq("id", session_id).execute()
+        return response.data[0]
+    return None
+
+
+async def get_recent_messages_async(session_id: int, limit: int) -> List[Dict]:
+    # The latest messages of a session, oldest first.
+    client = await get_async_supabase()
+    response = await (client.table("chat_messages").select("id, role, message, created_at").eq("session_id", session_id)
+                      .order("created_at", desc=True).order("id", desc=True).limit(limit).execute())
+    return list(reversed(response.data or []))
+
+
 def update_chat_session_name(session_id: int, new_name: str) -> Optional[Dict]:
     updates = {"session_name": new_name, "updated_at": datetime.now(timezone.utc).isoformat()}
     response = supabase.table("chat_sessions").update(updates).eq("id", session_id).execute()
@@ -79,56 +144,193 @@ def update_chat_session_title(session_id: int, new_title: str) -> Optional[Dict]
     return response.data[0] if response.data else None
 
 
+def _in_batches(ids: List, batch_size: int = DELETE_BATCH_SIZE) -> Iterator[List]:
+    # Keeps in_ filters (and so request URLs) bounded for very large deletes.
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+def _storage_path(file_url: str) -> Optional[str]:
+    marker = f"/object/public/{BUCKET_NAME}/"
+    if not file_url or marker not in file_url:
+        return None
+    return unquote(file_url.split(marker, 1)[1].split("?", 1)[0])
+
+
+def _remove_storage_objects(file_rows: List[Dict]):
+    # Runs after the files rows are gone. Content-addressed objects can be shared by other uploads of the same
+    # bytes, so they are kept while any remaining files row still has that hash.
+    hashes = list({row["content_hash"] for row in file_rows if row.get("content_hash")})
+    still_used = set()
+    for batch in _in_batches(hashes):
+        response = supabase.table("files").select("content_hash").in_("content_hash", batch).execute()
+        still_used.update(row["content_hash"] for row in response.data or [])
+    paths = list({
+        path for path in (_storage_path(row.get("file_url")) for row in file_rows
+                          if not row.get("content_hash") or row["content_hash"] not in still_used)
+        if path
+    })
+    for batch in _in_batches(paths, 1000):
+        try:
+            supabase.storage.from_(BUCKET_NAME).remove(batch)
+        except Exception as e:
+            print(f"Failed to remove {len(batch)} storage objects: {e}")
+
+
+def _delete_files(file_ids: List[int]):
+    # One in_ delete per table instead of round-trips per file.
+    if not file_ids:
+        return
+    file_rows = []
+    for batch in _in_batches(file_ids):
+        file_rows.extend(supabase.table("files").select("id, file_url, content_hash").in_("id", batch).execute().data or [])
+    for batch in _in_batches(file_ids):
+        supabase.table("file_chunks").delete().in_("file_id", batch).execute()
+    for batch in _in_batches(file_ids):
+        supabase.table("session_files").delete().in_("file_id", batch).execute()
+    for batch in _in_batches(file_ids):
+        supabase.table("files").delete().in_("id", batch).execute()
+    _remove_storage_objects(file_rows)
+
+
+def delete_chat_sessions(session_ids: List[int], user_id: Optional[int] = None) -> List[int]:
+    # Deletes the sessions with their files, chunks and links; with user_id, only sessions that user owns.
+    # Returns the ids that were deleted.
+    if not session_ids:
+        return []
+    session_ids = list(dict.fromkeys(session_ids))
+    if user_id is not None:
+        owned = []
+        for batch in _in_batches(session_ids):
+            response = supabase.table("chat_sessions").select("id").eq("user_id", user_id).in_("id", batch).execute()
+            owned.extend(row["id"] for row in response.data or [])
+        session_ids = owned
+        if not session_ids:
+            return []
+
+    file_ids = []
+    for batch in _in_batches(session_ids):
+        response = supabase.table("session_files").select("file_id").in_("session_id", batch).execute()
+        file_ids.extend(row["file_id"] for row in response.data or [])
+    _delete_files(list(dict.fromkeys(file_ids)))
+
+    deleted = []
+    for batch in _in_batches(session_ids):
+        response = supabase.table("chat_sessions").delete().in_("id", batch).execute()
+        deleted.extend(row["id"] for row in response.data or [])
+    return deleted
+
+
 def delete_chat_session(session_id: int) -> bool:
-    files = get_files_by_session_id(session_id)
-    file_ids = [file["file_id"] for file in files] if files else []
-    for file_id in file_ids:
-        delete_file_chunks(file_id)
-        supabase.table("session_files").delete().eq("session_id", session_id).eq("file_id", file_id).execute()
-    supabase.table("files").delete().in_("id", file_ids).execute()
-    response = supabase.table("chat_sessions").delete().eq("id", session_id).execute()
-    return bool(response.data)
+    return bool(delete_chat_sessions([session_id]))
 
 
 def delete_file_from_session(file_id: int) -> bool:
-    delete_file_chunks(file_id)
-    response = supabase.table("session_files").delete().eq("file_id", file_id).execute()
-    supabase.table("files").delete().eq("id", file_id).execute()
-    return bool(response.data)
+    linked = supabase.table("session_files").select("id").eq("file_id", file_id).execute()
+    _delete_files([file_id])
+    return bool(linked.data)
+
+
+def _insert_chunk_batch(batch: List[Dict]) -> List[Dict]:
+    # Upsert on the unique (session_id, file_id, chunk_index) key makes a retried batch idempotent.
+    for attempt in range(CHUNK_INSERT_RETRIES + 1):
+        try:
+            response = (
+                supabase.table("file_chunks")
+                .upsert(batch, on_conflict="session_id,file_id,chunk_index")
+                .execute()
+            )
+            if response.data:
+                return response.data
+            raise Exception("empty response")
+        except Exception as e:
+            print(f"Chunk batch of {len(batch)} failed ({attempt+1}/{CHUNK_INSERT_RETRIES+1}):", e)
+            if attempt < CHUNK_INSERT_RETRIES:
+                time.sleep(0.5 * (2 ** attempt))
+    raise Exception(f"Failed to insert chunk batch starting at chunk {batch[0].get('chunk_index')}")
+
+
+def _chunk_batches(records: Iterable[Dict]) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    batch_bytes = 0
+    for record in records:
+        size = len(json.dumps(record, default=str))
+        if batch and (len(batch) >= CHUNK_INSERT_BATCH_ROWS or batch_bytes + size > CHUNK_INSERT_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(record)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def _chunk_record(file_id: int, chunk: Dict, now: str) -> Dict:
+    record = {
+        "session_id": chunk.get("session_id"),
+        "file_id": file_id,
+        "file_name": chunk.get("file_name", "unknown"),
+        "chunk_index": chunk.get("chunk_index"),
+        "text": chunk.get("text"),
+        "embedding_model": chunk.get("embedding_model", "all-MiniLM-L6-v2"),
+        "embedding_b64": chunk.get("embedding_b64"),
+        "embedding_dtype": chunk.get("embedding_dtype"),
+        "embedding_scale": chunk.get("embedding_scale"),
+        "chunk_size": chunk.get("chunk_size"),
+        "page_start": chunk.get("page_start"),
+        "page_end": chunk.get("page_end"),
+        "created_at": now,
+    }
+    if chunk.get("embedding") is not None:
+        record["embedding"] = chunk["embedding"]
+    return record
 
 
-def create_file_chunks(file_id: int, chunks: List[Dict]) -> bool:
+def create_file_chunks(file_id: int, chunks: Iterable[Dict], progress: Optional[Callable] = None) -> Optional[List[Dict]]:
+    # Rows are written in batches bounded by row count and payload size, several in flight at once. chunks may be
+    # a generator: batches are sent as it produces them, so only the batches in flight are held in memory.
+    # progress(written_rows) is called as batches complete.
     now = datetime.now(timezone.utc).isoformat()
-    chunk_records = []
-
-    for chunk in chunks:
-        embedding = chunk.get("embedding")
-        if embedding is None:
-            print(f"Skipping chunk {chunk.get('chunk_index')} due to missing embedding")
-            continue
-        chunk_records.append({
-            "session_id": chunk.get("session_id"),
-            "file_id": file_id,
-            "file_name": chunk.get("file_name", "unknown"),
-            "chunk_index": chunk.get("chunk_index"),
-            "text": chunk.get("text"),
-            "embedding_model": chunk.get("embedding_model", "all-MiniLM-L6-v2"),
-            "embedding": embedding,
-            "chunk_size": chunk.get("chunk_size"),
-            "created_at": now,
-        })
-
-    if not chunk_records:
-        print("No valid chunks to insert for file_id:", file_id)
-        return False
 
-    response = supabase.table("file_chunks").insert(chunk_records).execute()
-    if response.data:
-        print(f"Inserted {len(chunk_records)} chunks for file_id: {file_id}")
-        return True
-    else:
-        print("Failed to insert chunks for file_id:", file_id)
-        return False
+    def records() -> Iterator[Dict]:
+        for chunk in chunks:
+            if chunk.get("embedding_b64") is None and chunk.get("embedding") is None:
+                print(f"Skipping chunk {chunk.get('chunk_index')} due to missing embedding")
+                continue
+            yield _chunk_record(file_id, chunk, now)
+
+    written = 0
+    rows: List[Dict] = []
+    in_flight: deque = deque()
+
+    def collect():
+        nonlocal written
+        done = in_flight.popleft().result()
+        # Only ids are kept; the written payloads are released with their batch.
+        rows.extend({"id": row["id"], "file_id": row["file_id"], "chunk_index": row["chunk_index"]} for row in done)
+        written += len(done)
+        if progress:
+            progress(written)
+
+    try:
+        for batch in _chunk_batches(records()):
+            in_flight.append(_chunk_insert_executor.submit(_insert_chunk_batch, batch))
+            # Backpressure: never more than CHUNK_INSERT_CONCURRENCY batches waiting on the database.
+            while len(in_flight) >= CHUNK_INSERT_CONCURRENCY:
+                collect()
+        while in_flight:
+            collect()
+    except Exception as e:
+        # Batches that did land stay in place; rerunning with the same chunks upserts over them.
+        print(f"Failed to insert chunks for file_id {file_id} ({written} written): {e}")
+        for future in in_flight:
+            future.cancel()
+        return None
+
+    if not rows:
+        print("No valid chunks to insert for file_id:", file_id)
+        return None
+    print(f"Inserted {len(rows)} chunks for file_id: {file_id}")
+    return rows
 
 
 def delete_file_chunks(file_id: int) -> bool:
@@ -141,53 +343,216 @@ def get_file_chunks_by_file_id(file_id: int) -> Optional[List[Dict]]:
     return response.data if response.data else None
 
 
+def get_legacy_file_chunks(limit: int = 500) -> List[Dict]:
+    response = (
+        supabase.table("file_chunks")
+        .select("id, embedding")
+        .is_("embedding_b64", "null")
+        .not_.is_("embedding", "null")
+        .limit(limit)
+        .execute()
+    )
+    return response.data or []
+
+
+def update_file_chunk(chunk_id: int, updates: Dict) -> bool:
+    response = supabase.table("file_chunks").update(updates).eq("id", chunk_id).execute()
+    return bool(response.data)
+
+
 def get_file_chunks_by_session_id(session_id: int) -> Optional[List[Dict]]:
     response = supabase.table("file_chunks").select("*").eq("session_id", session_id).execute()
     return response.data if response.data else None
 
 
-def count_chat_session_not_have_file(user_id: int) -> int:
-    session_files = supabase.table("session_files").select("session_id").execute().data
-    session_ids = [s["session_id"] for s in session_files] if session_files else []
-    query = supabase.table("chat_sessions").select("id", count="exact").eq("user_id", user_id)
-    if session_ids:
-        ids_str = "(" + ",".join(map(str, session_ids)) + ")"
-        query = query.filter("id", "not.in", ids_str)
-    response = query.execute()
-    return response.count if hasattr(response, "count") else 0
+def _chunk_embedding_columns(with_text: bool) -> str:
+    # text is only needed to rebuild a lexical index; vector-only loads stay at ids and embeddings.
+    return "id, file_id, " + ("text, " if with_text else "") + "embedding_b64, embedding_dtype, embedding_scale, embedding"
+
+
+def get_chunk_embeddings_by_session_id(session_id: int, with_text: bool = False) -> Optional[List[Dict]]:
+    response = (
+        supabase.table("file_chunks")
+        .select(_chunk_embedding_columns(with_text))
+        .eq("session_id", session_id)
+        .execute()
+    )
+    return response.data if response.data else None
+
+
+def get_chunk_texts_by_session_id(session_id: int) -> List[Dict]:
+    response = supabase.table("file_chunks").select("id, text").eq("session_id", session_id).execute()
+    return response.data or []
+
+
+def _chunk_fingerprint(response) -> Tuple[int, int]:
+    # (row count, highest id): an insert raises the highest id and a delete lowers the count.
+    return response.count or 0, (response.data[0]["id"] if response.data else 0)
+
+
+def get_chunk_fingerprint(session_id: int) -> Tuple[int, int]:
+    response = (
+        supabase.table("file_chunks")
+        .select("id", count="exact")
+        .eq("session_id", session_id)
+        .order("id", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return _chunk_fingerprint(response)
+
+
+def get_chunks_by_ids(chunk_ids: List[int]) -> List[Dict]:
+    if not chunk_ids:
+        return []
+    response = (
+        supabase.table("file_chunks")
+        .select("id, file_id, file_name, chunk_index, text, page_start, page_end")
+        .in_("id", chunk_ids)
+        .execute()
+    )
+    return response.data or []
+
+
+async def get_chunk_embeddings_by_session_id_async(session_id: int, with_text: bool = False) -> Optional[List[Dict]]:
+    client = await get_async_supabase()
+    response = await (
+        client.table("file_chunks")
+        .select(_chunk_embedding_columns(with_text))
+        .eq("session_id", session_id)
+        .execute()
+    )
+    return response.data if response.data else None
+
+
+async def get_chunk_fingerprint_async(session_id: int) -> Tuple[int, int]:
+    client = await get_async_supabase()
+    response = await (
+        client.table("file_chunks")
+        .select("id", count="exact")
+        .eq("session_id", session_id)
+        .order("id", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return _chunk_fingerprint(response)
+
+
+async def get_chunks_by_ids_async(chunk_ids: List[int]) -> List[Dict]:
+    if not chunk_ids:
+        return []
+    client = await get_async_supabase()
+    response = await (
+        client.table("file_chunks")
+        .select("id, file_id, file_name, chunk_index, text, page_start, page_end")
+        .in_("id", chunk_ids)
+        .execute()
+    )
+    return response.data or []
+
+
+def get_linked_session_ids(session_ids: List[int], batch_size: int = 500) -> set:
+    # Only the links of the given sessions are read (session_files.session_id is indexed).
+    linked = set()
+    for start in range(0, len(session_ids), batch_size):
+        batch = session_ids[start:start + batch_size]
+        response = supabase.table("session_files").select("session_id").in_("session_id", batch).execute()
+        linked.update(row["session_id"] for row in response.data or [])
+    return linked
 
 
 def get_chat_session_not_have_file(user_id: int) -> Optional[Dict]:
     all_sessions = supabase.table("chat_sessions").select("*").eq("user_id", user_id).execute()
     if not all_sessions.data:
         return None
-    linked_sessions = supabase.table("session_files").select("session_id").execute().data
-    linked_ids = {s["session_id"] for s in linked_sessions} if linked_sessions else set()
+    linked_ids = get_linked_session_ids([session["id"] for session in all_sessions.data])
     for session in all_sessions.data:
         if session["id"] not in linked_ids:
             return session
     return None
 
 
-def upload_file(user_id: int, uploaded_file: UploadFile) -> Dict:
-    unique_id = uuid.uuid4().hex
-    storage_path = f"{user_id}/{unique_id}_{uploaded_file.filename}"    
+def upload_file(user_id: int, uploaded_file: UploadFile, content_hash: Optional[str] = None) -> Dict:
+    if content_hash:
+        # Content-addressed: identical bytes map to one storage object however often they are uploaded.
+        storage_path = f"content/{content_hash}{os.path.splitext(uploaded_file.filename)[-1].lower()}"
+    else:
+        unique_id = uuid.uuid4().hex
+        storage_path = f"{user_id}/{unique_id}_{uploaded_file.filename}"
     content = uploaded_file.file.read()
     res = supabase.storage.from_(BUCKET_NAME).upload(storage_path, content, {"content-type": uploaded_file.content_type, "upsert": "true"})
     if not res or (isinstance(res, dict) and res.get("error")):
         raise Exception("Upload failed")
     public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(storage_path)
+    return create_file_record(user_id, uploaded_file.filename, public_url, uploaded_file.content_type, len(content), content_hash)
+
+
+def create_file_record(user_id: int, filename: str, file_url: str, file_type: str, file_size: int,
+                       content_hash: Optional[str] = None) -> Dict:
     file_record = {
         "user_id": user_id,
-        "filename": uploaded_file.filename,
-        "file_url": public_url,
-        "file_type": uploaded_file.content_type,
-        "file_size": len(content),
+        "filename": filename,
+        "file_url": file_url,
+        "file_type": file_type,
+        "file_size": file_size,
     }
+    if content_hash:
+        file_record["content_hash"] = content_hash
     db_res = supabase.table("files").insert(file_record).execute()
     file_id = db_res.data[0]["id"] if db_res.data else None
     return {"id": file_id, "db_response": db_res.data}
 
+
+def find_indexed_file_by_content_hash(content_hash: str, embedding_model: str) -> Optional[Dict]:
+    # embedding_model is only set once every chunk of the file was embedded and stored.
+    response = (
+        supabase.table("files")
+        .select("*")
+        .eq("content_hash", content_hash)
+        .eq("embedding_model", embedding_model)
+        .order("id", desc=True)
+        .limit(1)
+        .execute()
+    )
+    return response.data[0] if response.data else None
+
+
+def mark_file_indexed(file_id: int, embedding_model: str) -> bool:
+    response = supabase.table("files").update({"embedding_model": embedding_model}).eq("id", file_id).execute()
+    return bool(response.data)
+
+
+def copy_file_chunks(source_file_id: int, session_id: int, file_id: int, file_name: str,
+                     page_size: int = 1000) -> Optional[List[Dict]]:
+    # Re-links an already embedded file to another session: chunk text and stored vectors are copied, not recomputed.
+    # file_name is the new upload's name, so answers cite it rather than the name the source was uploaded under.
+    rows = []
+    start = 0
+    while True:
+        response = (
+            supabase.table("file_chunks")
+            .select("chunk_index, file_name, text, embedding_model, embedding_b64, embedding_dtype, embedding_scale, embedding, chunk_size, page_start, page_end")
+            .eq("file_id", source_file_id)
+            .order("chunk_index")
+            .range(start, start + page_size - 1)
+            .execute()
+        )
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            break
+        start += page_size
+    if not rows:
+        return None
+
+    records = [{**row, "session_id": session_id, "file_name": file_name} for row in rows]
+    created = create_file_chunks(file_id, records)
+    if not created:
+        return None
+    by_chunk_index = {row["chunk_index"]: row for row in records}
+    return [{**by_chunk_index[row["chunk_index"]], **row} for row in created]
+
+
 def link_file_to_session(session_id: int, file_id: int) -> bool:
     now = datetime.now(timezone.utc).isoformat()
     link_record = {"session_id": session_id, "file_id": file_id, "created_at": now}
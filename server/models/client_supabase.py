@@ -1,5 +1,7 @@
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client, AsyncClient
 from dotenv import load_dotenv
+from typing import Optional
+import asyncio
 import os
 
 load_dotenv()
@@ -9,3 +11,20 @@ SUPABASE_KEY: str = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET: str = os.getenv("SUPABASE_BUCKET", "chat-files") 
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+_async_supabase: Optional[AsyncClient] = None
+_async_supabase_loop: Optional[asyncio.AbstractEventLoop] = None
+_async_supabase_lock: Optional[asyncio.Lock] = None
+
+
+async def get_async_supabase() -> AsyncClient:
+    # Like llm_client: the pooled HTTP client (and the lock) belong to the event loop that created them.
+    global _async_supabase, _async_supabase_loop, _async_supabase_lock
+    loop = asyncio.get_running_loop()
+    if _async_supabase_loop is not loop:
+        _async_supabase, _async_supabase_loop, _async_supabase_lock = None, loop, asyncio.Lock()
+    if _async_supabase is None:
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _async_supabase
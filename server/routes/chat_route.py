@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, Query, UploadFile, File, Form
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import Optional, List
 from auth import get_current_user
 from controllers import chat_controller
 from pydantic import BaseModel
@@ -7,7 +8,11 @@ from pydantic import BaseModel
 router = APIRouter(prefix="", tags=["chats"])
 
 @router.get("/user/")
-def get_chats_by_user(user_id: int = Depends(get_current_user)):
+def get_chats_by_user(limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = Query(None),
+                      fields: Optional[str] = Query(None), user_id: int = Depends(get_current_user)):
+    # Without limit/cursor the full list is returned as before; with them, a { items, next_cursor } page.
+    if limit is not None or cursor is not None:
+        return chat_controller.get_chat_sessions_page(user_id, limit, cursor, fields)
     sessions = chat_controller.get_chat_sessions_by_user_id(user_id)
     return sessions if sessions else []
 
@@ -19,6 +24,10 @@ def create_chat(title: Optional[str] = Query("New Chat"), user_id: int = Depends
 def get_chats_by_user_id(user_id: int):
     return chat_controller.get_chat_sessions_by_user_id(user_id)
 
+@router.get("/metrics")
+def get_metrics():
+    return chat_controller.get_metrics()
+
 @router.get("/file/{file_id}")
 def get_file(file_id: int):
     return chat_controller.get_file(file_id)
@@ -28,17 +37,28 @@ def get_chat(chat_id: int):
     return chat_controller.get_chat_session_by_id(chat_id)
 
 @router.get("/session/{chat_id}/messages")
-def get_messages(chat_id: int):
+def get_messages(chat_id: int, limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = Query(None),
+                 fields: Optional[str] = Query(None)):
+    if limit is not None or cursor is not None:
+        return chat_controller.get_chat_messages_page(chat_id, limit, cursor, fields)
     return chat_controller.get_chat_messages(chat_id)
 
 @router.get("/session/{chat_id}/files")
 def get_files(chat_id: int):
     return chat_controller.get_files(chat_id)
 
-@router.post("/session/{session_id}/upload")
+@router.post("/session/{session_id}/upload", status_code=202)
 def upload_file(session_id: int, file: UploadFile = File(...), user_id: int = Depends(get_current_user)):
     return chat_controller.upload_file(user_id, session_id, file)
 
+@router.get("/jobs")
+def get_upload_jobs(session_id: Optional[int] = Query(None), user_id: int = Depends(get_current_user)):
+    return chat_controller.get_upload_jobs(user_id, session_id)
+
+@router.get("/jobs/{job_id}")
+def get_upload_job(job_id: str, user_id: int = Depends(get_current_user)):
+    return chat_controller.get_upload_job(job_id, user_id)
+
 class MessageCreate(BaseModel):
     role: str
     content: str
@@ -58,13 +78,30 @@ def rename_chat(chat_id: int, request: RenameRequest):
 def delete_chat(chat_id: int):
     return chat_controller.delete_chat_session(chat_id)
 
+class BulkDeleteRequest(BaseModel):
+    session_ids: List[int]
+
+@router.post("/sessions/bulk-delete")
+def delete_chats(request: BulkDeleteRequest, user_id: int = Depends(get_current_user)):
+    return chat_controller.delete_chat_sessions(user_id, request.session_ids)
+
 @router.delete("/file/{file_id}")
 def delete_file(file_id: int):
     return chat_controller.delete_file(file_id)
 
 class ProcessRequest(BaseModel):
     user_message: str
+    save_user_message: bool = False
 
 @router.post("/session/{chat_id}/process")
-def process_message(chat_id: int, request: ProcessRequest):
-    return chat_controller.process_user_message(chat_id, request.user_message)
\ No newline at end of file
+async def process_message(chat_id: int, request: ProcessRequest):
+    return await chat_controller.process_user_message(chat_id, request.user_message, request.save_user_message)
+
+@router.post("/session/{chat_id}/process/stream")
+async def process_message_stream(chat_id: int, request: ProcessRequest):
+    events = await chat_controller.stream_user_message(chat_id, request.user_message, request.save_user_message)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
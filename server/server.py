@@ -1,10 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from routes.user_route import router as user_router
 from routes.chat_route import router as chat_router
+from controllers import chat_controller
 import os
 
-app = FastAPI(title="Doc Chat App API", version="1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the embedder in the background so startup never waits on the model or the remote space.
+    chat_controller.start_embedding_warmup()
+    yield
+    chat_controller.shutdown()
+
+app = FastAPI(title="Doc Chat App API", version="1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +35,11 @@ def root():
 def health():
     return {"ok": True}
 
+@app.get("/ready")
+def ready():
+    readiness = chat_controller.get_readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ok"] else 503)
+
 if __name__ == "__main__":
     import uvicorn
     base_dir = os.path.dirname(os.path.abspath(__file__))
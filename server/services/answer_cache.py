@@ -0,0 +1,175 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Optional, Dict, List, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2048))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between query embeddings for a paraphrase to reuse an answer.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_MAX_PER_SESSION = int(os.getenv("SEMANTIC_CACHE_MAX_PER_SESSION", 64))
+SEMANTIC_CACHE_MAX_SESSIONS = int(os.getenv("SEMANTIC_CACHE_MAX_SESSIONS", 512))
+
+_entries: "OrderedDict[Tuple, Tuple[str, float]]" = OrderedDict()
+# Document-set version per session, bumped whenever a file is added to or removed from it.
+_versions: Dict[int, int] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+# session_id -> entries of (unit query vector, retrieved chunk ids, answer, expires_at, template version, history key),
+# oldest first
+_semantic: "OrderedDict[int, List[Tuple[np.ndarray, frozenset, str, float, str, str]]]" = OrderedDict()
+_semantic_stats = {"hits": 0, "misses": 0, "chunk_mismatches": 0}
+# Best similarity seen per lookup, to tune SEMANTIC_CACHE_THRESHOLD from /chat/metrics.
+_recent_similarities = deque(maxlen=500)
+
+
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.。 ")
+
+
+def document_version(session_id: int) -> int:
+    with _lock:
+        return _versions.get(session_id, 0)
+
+
+def _key(session_id: int, version: int, question: str, template_version: str, history_key: str) -> Tuple:
+    return (session_id, version, normalize_question(question), template_version, history_key)
+
+
+def get(session_id: int, version: int, question: str, template_version: str, history_key: str = "") -> Optional[str]:
+    # history_key fingerprints the conversation turns in the prompt: a follow-up is only answered the same way
+    # after the same conversation.
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    key = _key(session_id, version, question, template_version, history_key)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None or entry[1] < time.time() or _versions.get(session_id, 0) != version:
+            if entry is not None:
+                del _entries[key]
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry[0]
+
+
+def put(session_id: int, version: int, question: str, template_version: str, answer: str, history_key: str = ""):
+    # version is the one read before retrieval, so an answer computed while files changed is never served.
+    if not ANSWER_CACHE_ENABLED or not answer:
+        return
+    key = _key(session_id, version, question, template_version, history_key)
+    with _lock:
+        if _versions.get(session_id, 0) != version:
+            return
+        _entries[key] = (answer, time.time() + ANSWER_CACHE_TTL_SECONDS)
+        _entries.move_to_end(key)
+        while len(_entries) > ANSWER_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+def semantic_get(session_id: int, version: int, query_embedding: np.ndarray, chunk_ids: List[int],
+                 template_version: str, history_key: str = "") -> Optional[str]:
+    # A paraphrase hits only if it is close enough to a cached query and retrieval picked the same chunks,
+    # so the cached answer was generated from exactly the context this query would get.
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    query = _unit(query_embedding)
+    wanted = frozenset(chunk_ids)
+    now = time.time()
+    with _lock:
+        entries = _semantic.get(session_id)
+        if _versions.get(session_id, 0) != version or not entries:
+            _semantic_stats["misses"] += 1
+            return None
+        entries[:] = [entry for entry in entries if entry[3] >= now]
+        candidates = [entry for entry in entries
+                      if entry[4] == template_version and entry[5] == history_key and entry[0].shape == query.shape]
+        if not candidates:
+            _semantic_stats["misses"] += 1
+            return None
+        _semantic.move_to_end(session_id)
+        similarities = np.stack([entry[0] for entry in candidates]) @ query
+        best_similarity = float(similarities.max())
+        _recent_similarities.append(best_similarity)
+        for i in np.argsort(-similarities):
+            if similarities[i] < SEMANTIC_CACHE_THRESHOLD:
+                break
+            if candidates[i][1] == wanted:
+                _semantic_stats["hits"] += 1
+                return candidates[i][2]
+        if best_similarity >= SEMANTIC_CACHE_THRESHOLD:
+            _semantic_stats["chunk_mismatches"] += 1
+        _semantic_stats["misses"] += 1
+        return None
+
+
+def semantic_put(session_id: int, version: int, query_embedding: np.ndarray, chunk_ids: List[int],
+                 template_version: str, answer: str, history_key: str = ""):
+    if not SEMANTIC_CACHE_ENABLED or not answer:
+        return
+    entry = (_unit(query_embedding), frozenset(chunk_ids), answer, time.time() + ANSWER_CACHE_TTL_SECONDS,
+             template_version, history_key)
+    with _lock:
+        if _versions.get(session_id, 0) != version:
+            return
+        entries = _semantic.setdefault(session_id, [])
+        entries.append(entry)
+        del entries[:-SEMANTIC_CACHE_MAX_PER_SESSION]
+        _semantic.move_to_end(session_id)
+        while len(_semantic) > SEMANTIC_CACHE_MAX_SESSIONS:
+            _semantic.popitem(last=False)
+
+
+def invalidate_session(session_id: int):
+    with _lock:
+        _versions[session_id] = _versions.get(session_id, 0) + 1
+        for key in [key for key in _entries if key[0] == session_id]:
+            del _entries[key]
+        _semantic.pop(session_id, None)
+        _stats["invalidations"] += 1
+
+
+def stats() -> Dict:
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["entries"] = len(_entries)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+    snapshot["enabled"] = ANSWER_CACHE_ENABLED
+    snapshot["semantic"] = semantic_stats()
+    return snapshot
+
+
+def semantic_stats() -> Dict:
+    with _lock:
+        snapshot = dict(_semantic_stats)
+        snapshot["sessions"] = len(_semantic)
+        snapshot["entries"] = sum(len(entries) for entries in _semantic.values())
+        similarities = sorted(_recent_similarities)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+    snapshot["threshold"] = SEMANTIC_CACHE_THRESHOLD
+    snapshot["enabled"] = SEMANTIC_CACHE_ENABLED
+    if similarities:
+        snapshot["best_similarity_p50"] = similarities[len(similarities) // 2]
+        snapshot["best_similarity_p90"] = similarities[min(len(similarities) - 1, int(len(similarities) * 0.9))]
+    return snapshot
@@ -1,51 +1,108 @@
 import time
+import asyncio
+import base64
+import hashlib
+from datetime import datetime
+import threading
 import numpy as np
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, AsyncIterator, Callable, Union, Iterable, Iterator, Tuple
 from fastapi import HTTPException, UploadFile
 from docx import Document
-import pdfplumber
 from dotenv import load_dotenv
-from groq import Groq
-import tempfile
-import requests
+import io
 import os
-import ast
+import json
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-import pytesseract
-from pdf2image import convert_from_path
 
 import models.chat_model as chat_model
+import services.session_index_cache as session_index_cache
+import services.vector_index as vector_index
+import services.embedding_codec as embedding_codec
+import services.llm_client as llm_client
+import services.embedding_cache as embedding_cache
+import services.embedding_provider as embedding_provider
+import services.ingestion_jobs as ingestion_jobs
+import services.pdf_extraction as pdf_extraction
+import services.chunking as chunking
+import services.lexical_index as lexical_index
+import services.answer_cache as answer_cache
+import services.conversation_history as conversation_history
+import services.prompt_budget as prompt_budget
 
 load_dotenv()
 
-client_gradio = None
-MAX_RETRIES = 10
-
-def load_gradio_client():
-    global client_gradio
-    retries = 0
-    from gradio_client import Client as GradioClient
-    while retries < MAX_RETRIES and client_gradio is None:
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_BATCH_RETRIES = int(os.getenv("EMBEDDING_BATCH_RETRIES", 2))
+_embedding_executor = ThreadPoolExecutor(max_workers=EMBEDDING_MAX_CONCURRENCY, thread_name_prefix="embedding")
+# hybrid: BM25 and vector results fused with reciprocal rank fusion; vector: embeddings only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 20))
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", 60))
+_retrieval_stats = {"vector": 0, "hybrid": 0, "lexical_only": 0}
+_retrieval_lock = threading.Lock()
+# Share of PROMPT_TOKEN_BUDGET given to earlier conversation turns; the documents get what is left.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 800))
+# A passage that no longer fits whole is included shortened if at least this many tokens remain.
+PROMPT_MIN_PASSAGE_TOKENS = int(os.getenv("PROMPT_MIN_PASSAGE_TOKENS", 64))
+_prompt_stats = {"prompts": 0, "tokens": 0, "max_tokens": 0, "history_messages": 0, "passages_truncated": 0, "passages_dropped": 0}
+_prompt_lock = threading.Lock()
+_upload_executor = ThreadPoolExecutor(max_workers=ingestion_jobs.INGESTION_WORKERS, thread_name_prefix="storage-upload")
+BULK_DELETE_MAX_SESSIONS = int(os.getenv("BULK_DELETE_MAX_SESSIONS", 1000))
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", 50))
+CHAT_PAGE_MAX_SIZE = int(os.getenv("CHAT_PAGE_MAX_SIZE", 200))
+# Columns a paginated listing may project; the cursor columns are always returned.
+_SESSION_COLUMNS = ("id", "user_id", "session_name", "created_at", "updated_at")
+_MESSAGE_COLUMNS = ("id", "session_id", "role", "message", "created_at")
+
+def _predict_batch(batch: List[str]) -> List[Optional[np.ndarray]]:
+    provider = embedding_provider.get_provider()
+    for attempt in range(EMBEDDING_BATCH_RETRIES + 1):
         try:
-            client_gradio = GradioClient("BienKieu/sentence-embedding")
-
-            client_gradio.predict("Test")
+            res = provider.embed(batch)
+            if len(res) != len(batch):
+                raise ValueError(f"expected {len(batch)} embeddings, got {len(res)}")
+            return list(res)
         except Exception as e:
-            print(f"Gradio client load failed ({retries+1}/{MAX_RETRIES}):", e)
-            client_gradio = None
-            retries += 1
-            time.sleep(1)
-    if client_gradio is None:
-        print("Failed to load Gradio client after retries")
+            print(f"Embedding batch of {len(batch)} failed ({attempt+1}/{EMBEDDING_BATCH_RETRIES+1}):", e)
+            if attempt < EMBEDDING_BATCH_RETRIES:
+                time.sleep(0.5 * (2 ** attempt))
+    return [None] * len(batch)
+
+
+def _embed_uncached(texts: List[str]) -> List[Optional[np.ndarray]]:
+    provider = embedding_provider.ensure_loaded()
+    if not provider.ready:
+        raise RuntimeError(f"Embedding provider '{provider.name}' is not available")
+    batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    if len(batches) == 1 or not provider.parallel_batches:
+        return [emb for batch in batches for emb in _predict_batch(batch)]
+    results = []
+    # map() keeps batch order, so results line up with texts even though batches finish out of order.
+    for batch_result in _embedding_executor.map(_predict_batch, batches):
+        results.extend(batch_result)
+    return results
+
+
+def embed_texts(texts: List[str]) -> List[Optional[np.ndarray]]:
+    model_name = embedding_provider.get_provider().model_name
+    embeddings = embedding_cache.get_many(texts, model_name)
+    missing_texts = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+    if missing_texts:
+        computed = dict(zip(missing_texts, _embed_uncached(missing_texts)))
+        embedding_cache.put_many(missing_texts, [computed[text] for text in missing_texts], model_name)
+        embeddings = [emb if emb is not None else computed[text] for text, emb in zip(texts, embeddings)]
+    return embeddings
 
-load_gradio_client()
 
 def get_embeddings(texts):
-    if client_gradio is None:
-        raise RuntimeError("Gradio client is not available")
-    
-    res = client_gradio.predict(texts)  
-    return np.array(res)  
+    embeddings = embed_texts(texts)
+    if any(emb is None for emb in embeddings):
+        raise RuntimeError("Embedding service failed")
+    return np.array(embeddings)
 
 
 def get_chat_sessions_by_user_id(user_id: int) -> list:
@@ -53,6 +110,61 @@ def get_chat_sessions_by_user_id(user_id: int) -> list:
     return chats if chats else []
 
 
+def _encode_cursor(row: Dict, time_column: str) -> str:
+    raw = json.dumps([row[time_column], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    # Cursors come from the client: the timestamp is parsed (never passed through) before it reaches a filter.
+    if not cursor:
+        return None
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(value[0]), int(value[1])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _projection(fields: Optional[str], allowed: Tuple[str, ...], time_column: str) -> str:
+    if not fields:
+        return "*"
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ",".join(dict.fromkeys(["id", time_column] + wanted))
+
+
+def _page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or CHAT_PAGE_SIZE, CHAT_PAGE_MAX_SIZE))
+
+
+def _page(rows: List[Dict], limit: int, time_column: str) -> Dict:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {"items": rows, "next_cursor": _encode_cursor(rows[-1], time_column) if has_more else None}
+
+
+def get_chat_sessions_page(user_id: int, limit: Optional[int] = None, cursor: Optional[str] = None,
+                           fields: Optional[str] = None) -> Dict:
+    limit = _page_size(limit)
+    columns = _projection(fields, _SESSION_COLUMNS, "updated_at")
+    rows = chat_model.get_chat_sessions_page(user_id, limit, _decode_cursor(cursor), columns)
+    return _page(rows, limit, "updated_at")
+
+
+def get_messages_page(session_id: int, limit: Optional[int] = None, cursor: Optional[str] = None,
+                      fields: Optional[str] = None) -> Dict:
+    # items are in chronological order; next_cursor fetches the messages before them.
+    limit = _page_size(limit)
+    columns = _projection(fields, _MESSAGE_COLUMNS, "created_at")
+    rows = chat_model.get_messages_page(session_id, limit, _decode_cursor(cursor), columns)
+    page = _page(rows, limit, "created_at")
+    page["items"].reverse()
+    return page
+
+
 def get_chat_session_by_id(chat_id: int) -> Dict:
     chat = chat_model.get_chat_session_by_id(chat_id)
     if not chat:
@@ -89,13 +201,23 @@ def get_chat_session_not_have_file(user_id: int) -> Dict:
 
 
 def create_new_chat_session(user_id: int, title: str = "New Chat") -> Dict:
-    if chat_model.count_chat_session_not_have_file(user_id) > 0:
-        return chat_model.get_chat_session_not_have_file(user_id)
+    # Reuse an empty session instead of creating another one; one user-scoped lookup answers both questions.
+    session = chat_model.get_chat_session_not_have_file(user_id)
+    if session:
+        return session
     return chat_model.create_chat_session(user_id, title)
 
 
 def create_new_chat_message(session_id: int, role: str, content: str) -> Dict:
-    return chat_model.create_chat_message(session_id, role, content)
+    saved = chat_model.create_chat_message(session_id, role, content)
+    conversation_history.append(session_id, saved)
+    return saved
+
+
+async def _save_message(session_id: int, role: str, content: str) -> Optional[Dict]:
+    saved = await chat_model.create_chat_message_async(session_id, role, content)
+    conversation_history.append(session_id, saved)
+    return saved
 
 
 def update_chat_session(session_id: int, new_name: str) -> Dict:
@@ -106,31 +228,14 @@ def update_chat_session(session_id: int, new_name: str) -> Dict:
         raise HTTPException(status_code=404, detail="Session not found")
     return result
 
-def read_pdf(path: str) -> str:
-    text = ""
-    try:
-        with pdfplumber.open(path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                t = page.extract_text()
-                if t and t.strip():
-                    text += t + "\n"
-                else:
-                    try:
-                        images = convert_from_path(path, first_page=page_num, last_page=page_num)
-                        for img in images:
-                            ocr_text = pytesseract.image_to_string(img, lang='eng')
-                            if ocr_text.strip():
-                                text += ocr_text + "\n"
-                    except:
-                        pass
-    except:
-        pass
-    return text.strip()
+def _as_source(source: Union[str, bytes]):
+    # Readers take either a path or the raw bytes of an upload; bytes are parsed without touching disk.
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
 
-def read_word(path: str) -> str:
+def read_word(source: Union[str, bytes]) -> str:
     text_parts = []
     try:
-        doc = Document(path)
+        doc = Document(_as_source(source))
         for p in doc.paragraphs:
             if p.text.strip():
                 text_parts.append(p.text)
@@ -143,130 +248,337 @@ def read_word(path: str) -> str:
         pass
     return "\n".join(text_parts).strip()
 
-def read_txt(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
+def read_txt(source: Union[str, bytes]) -> str:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source).decode("utf-8")
+    with open(source, "r", encoding="utf-8") as f:
         return f.read()
 
-def read_md(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+def read_md(source: Union[str, bytes]) -> str:
+    return read_txt(source)
+
+_READERS = {".docx": read_word, ".txt": read_txt, ".md": read_md}
 
-def chunk_text(text: str, chunk_size: int = 200, overlap: int = 20) -> List[str]:
-    words = text.split()
-    chunks = []
-    start = 0
-    while start < len(words):
-        end = start + chunk_size
-        chunks.append(" ".join(words[start:end]))
-        start += chunk_size - overlap
-    return chunks
-
-def create_faiss_index_for_file(session_id: int, file_id: int, embedding_model_name: str = "all-MiniLM-L6-v2") -> bool:
+def iter_document_pages(filename: str, content: bytes) -> Optional[Iterator[Tuple[int, str]]]:
+    # (page_number, text) pairs; PDFs are yielded page by page while extraction is still running.
+    # None means the file type is not supported.
+    suffix = os.path.splitext(filename)[-1].lower().split("?")[0]
+    if suffix == ".pdf":
+        return _guard_pages(filename, pdf_extraction.iter_pages(content))
+    reader = _READERS.get(suffix)
+    if reader is None:
+        return None
+    return _guard_pages(filename, _whole_document(reader, content))
+
+def _whole_document(reader: Callable, content: bytes) -> Iterator[Tuple[int, str]]:
+    # DOCX/TXT/MD carry no page structure; the whole text counts as page 1.
+    yield 1, reader(content)
+
+def _guard_pages(filename: str, pages: Iterator[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
     try:
-        file_info = chat_model.get_file_by_id(file_id)
-        if not file_info:
-            return False
-
-        file_url = file_info.get("file_url")
-        if not file_url:
-            return False
-
-        r = requests.get(file_url)
-        if r.status_code != 200:
-            return False
-
-        suffix = os.path.splitext(file_url)[-1].lower().split("?")[0]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(r.content)
-            tmp_path = tmp.name
-
-        text = ""
-        if suffix == ".pdf":
-            text = read_pdf(tmp_path)
-        elif suffix == ".docx":
-            text = read_word(tmp_path)
-        elif suffix == ".txt":
-            text = read_txt(tmp_path)
-        elif suffix == ".md":
-            text = read_md(tmp_path)
-        else:
-            os.unlink(tmp_path)
-            return False
-
-        os.unlink(tmp_path)
-        if not text.strip():
-            return False
-        
-        file_name = file_info.get("filename")
-
-        chunks = chunk_text(text, chunk_size=200, overlap=20)
-        embeddings = get_embeddings(chunks)
-        if len(chunks) != len(embeddings):
-            return False
-
-        chunk_records = []
-        for idx, (chunk, emb) in enumerate(zip(chunks, embeddings)):
+        yield from pages
+    except Exception as e:
+        print(f"Error extracting text from {filename}: {e}")
+
+def embed_chunk_stream(chunks: Iterable[Dict]) -> Iterator[Tuple[Dict, Optional[np.ndarray]]]:
+    # Batches go to the embedder as soon as they fill up, so embedding overlaps extraction and chunking.
+    # (chunk, embedding) pairs are yielded in order as their batch completes; only in-flight batches are held.
+    in_flight: deque = deque()  # (chunks, future)
+    batch: List[Dict] = []
+    try:
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= EMBEDDING_BATCH_SIZE:
+                in_flight.append((batch, _embedding_executor.submit(embed_texts, [c["text"] for c in batch])))
+                batch = []
+                while len(in_flight) > EMBEDDING_MAX_CONCURRENCY:
+                    done, future = in_flight.popleft()
+                    yield from zip(done, future.result())
+        if batch:
+            in_flight.append((batch, _embedding_executor.submit(embed_texts, [c["text"] for c in batch])))
+        while in_flight:
+            done, future = in_flight.popleft()
+            yield from zip(done, future.result())
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+def store_file_chunks(session_id: int, file_id: int, file_name: str,
+                      embedded: Iterable[Tuple[Dict, Optional[np.ndarray]]], embedding_model_name: Optional[str] = None,
+                      report: Optional[Callable] = None) -> Tuple[int, int]:
+    # Rows are written batch by batch while later chunks are still being embedded.
+    # Returns (chunks seen, chunks stored); nothing counts as stored when a write failed.
+    embedding_model_name = embedding_model_name or embedding_provider.get_provider().model_name
+    report = report or (lambda stage, progress: None)
+    # A session index held in memory is patched with the new rows, so only then are their vectors and texts kept;
+    # otherwise the index is rebuilt from the database once the rows are written.
+    patch_index = session_index_cache.get(session_id) is not None
+    kept_embeddings: List[np.ndarray] = []
+    kept_chunks: List[Tuple[int, str]] = []  # (chunk_index, text)
+    seen = 0
+
+    def records() -> Iterator[Dict]:
+        nonlocal seen
+        for idx, (chunk, emb) in enumerate(embedded):
+            seen += 1
             if emb is None:
                 continue
-            chunk_records.append({
+            if patch_index:
+                kept_embeddings.append(emb)
+                kept_chunks.append((idx, chunk["text"]))
+            yield {
                 "session_id": session_id,
                 "file_id": file_id,
                 "file_name": file_name,
                 "chunk_index": idx,
-                "text": chunk,
-                "embedding": emb.tolist(),
+                "text": chunk["text"],
+                **embedding_codec.encode_embedding(emb),
                 "embedding_model": embedding_model_name,
-                "chunk_size": len(chunk),
-            })
-
-        if not chunk_records:
-            return False
-
-        return chat_model.create_file_chunks(file_id, chunk_records)
-
-    except Exception as e:
-        print(f"Error in create_faiss_index_for_file: {e}")
-        return False
-
-def search_similar_chunks(session_id: int, query_embedding: np.ndarray, top_k: int = 5) -> List[Dict]:
-    chunks = chat_model.get_file_chunks_by_session_id(session_id)
+                "chunk_size": len(chunk["text"]),
+                "page_start": chunk.get("page_start"),
+                "page_end": chunk.get("page_end"),
+            }
+
+    # The total is unknown while pages are still streaming in, so progress approaches 0.9 as rows land.
+    created = chat_model.create_file_chunks(
+        file_id, records(), progress=lambda written: report("saving", 0.2 + 0.7 * written / (written + 1000))
+    )
+    if not created:
+        return seen, 0
+
+    report("indexing", 0.95)
+    if patch_index:
+        ids_by_chunk_index = {row["chunk_index"]: row["id"] for row in created}
+        add_chunks_to_session_index(
+            session_id,
+            np.stack(kept_embeddings),
+            [{"id": ids_by_chunk_index.get(idx), "file_id": file_id} for idx, _ in kept_chunks],
+            [text for _, text in kept_chunks],
+        )
+    else:
+        refresh_session_index(session_id)
+    return seen, len(created)
+
+def add_chunks_to_session_index(session_id: int, embeddings: np.ndarray, chunks: List[Dict], texts: List[str]):
+    answer_cache.invalidate_session(session_id)
+    index = session_index_cache.append_chunks(session_id, embeddings, chunks, texts)
+    if index is not None:
+        persist_session_index(session_id, index)
+    else:
+        refresh_session_index(session_id)
+
+def refresh_session_index(session_id: int):
+    # Drops the session's in-memory and persisted snapshots and rebuilds them from the database.
+    answer_cache.invalidate_session(session_id)
+    session_index_cache.invalidate(session_id)
+    vector_index.delete_session_index(session_id)
+    load_session_index(session_id)
+
+def persist_session_index(session_id: int, index: session_index_cache.SessionIndex) -> bool:
+    return vector_index.save_session_index(session_id, index.embeddings, index.chunks, index.vectors, index.lexical,
+                                           index.fingerprint)
+
+
+def _load_stored_session_index(session_id: int, generation: tuple,
+                               fingerprint: Tuple[int, int]) -> Optional[session_index_cache.SessionIndex]:
+    stored = vector_index.load_session_index(session_id, fingerprint)
+    if stored is None:
+        return None
+    embeddings, chunks, vectors, lexical = stored
+    rebuilt_lexical = lexical is None and RETRIEVAL_MODE == "hybrid"
+    if rebuilt_lexical:
+        # Saved without a lexical index: the vectors are reused and only chunk texts are fetched to add it.
+        texts = {row["id"]: row.get("text") or "" for row in chat_model.get_chunk_texts_by_session_id(session_id)}
+        if any(chunk["id"] not in texts for chunk in chunks):
+            return None
+        lexical = lexical_index.LexicalIndex.build([texts[chunk["id"]] for chunk in chunks])
+    index = session_index_cache.SessionIndex(embeddings, chunks, normalized=True, vectors=vectors, lexical=lexical,
+                                             fingerprint=fingerprint)
+    session_index_cache.put(session_id, index, expected_generation=generation)
+    if rebuilt_lexical and session_index_cache.generation(session_id) == generation:
+        persist_session_index(session_id, index)
+    return index
+
+
+def _build_session_index(session_id: int, chunks: Optional[List[Dict]], generation: tuple,
+                         fingerprint: Tuple[int, int]) -> Optional[session_index_cache.SessionIndex]:
     if not chunks:
-        return []
+        return None
 
-    valid_chunks = []
     embeddings_list = []
-
-    for chunk in chunks:
-        emb = chunk.get("embedding")
+    valid_chunks = []
+    texts = []
+    dim = None
+    for chunk, emb in zip(chunks, embedding_codec.decode_embeddings(chunks)):
         if emb is None:
             continue
-        if isinstance(emb, str):
-            emb = np.array(ast.literal_eval(emb), dtype="float32")
-        else:
-            emb = np.array(emb, dtype="float32")
-        if emb.shape[0] != len(query_embedding):
+        if dim is None:
+            dim = emb.shape[0]
+        if emb.shape[0] != dim:
             continue
         embeddings_list.append(emb)
-        valid_chunks.append(chunk)
+        valid_chunks.append({"id": chunk["id"], "file_id": chunk.get("file_id")})
+        texts.append(chunk.get("text") or "")
 
     if not embeddings_list:
+        return None
+
+    lexical = lexical_index.LexicalIndex.build(texts) if RETRIEVAL_MODE == "hybrid" else None
+    index = session_index_cache.SessionIndex(np.stack(embeddings_list), valid_chunks, lexical=lexical,
+                                             fingerprint=fingerprint)
+    session_index_cache.put(session_id, index, expected_generation=generation)
+    if session_index_cache.generation(session_id) == generation:
+        persist_session_index(session_id, index)
+    return index
+
+
+def _still_current(session_id: int, cached: Optional[session_index_cache.SessionIndex],
+                   fingerprint: Tuple[int, int]) -> bool:
+    # An expired cache entry is reused while the session's chunks are unchanged; otherwise it is replaced below.
+    if cached is None:
+        return False
+    if cached.fingerprint == fingerprint:
+        session_index_cache.confirm(cached)
+        return True
+    # Files were added or removed through another worker; the rebuilt index replaces the entry.
+    answer_cache.invalidate_session(session_id)
+    return False
+
+
+def load_session_index(session_id: int) -> Optional[session_index_cache.SessionIndex]:
+    cached = session_index_cache.get(session_id)
+    if cached is not None and not cached.expired():
+        return cached
+
+    generation = session_index_cache.generation(session_id)
+    # Taken before the chunks are read: a write landing in between makes the next check rebuild, never skip.
+    fingerprint = chat_model.get_chunk_fingerprint(session_id)
+    if _still_current(session_id, cached, fingerprint):
+        return cached
+    if fingerprint[0] == 0:
+        session_index_cache.invalidate(session_id)
+        vector_index.delete_session_index(session_id)
+        return None
+    index = _load_stored_session_index(session_id, generation, fingerprint)
+    if index is not None:
+        return index
+
+    # Phase one of retrieval: ids and vectors (plus text when the lexical index is built); only winners are hydrated.
+    chunks = chat_model.get_chunk_embeddings_by_session_id(session_id, with_text=RETRIEVAL_MODE == "hybrid")
+    return _build_session_index(session_id, chunks, generation, fingerprint)
+
+
+async def load_session_index_async(session_id: int) -> Optional[session_index_cache.SessionIndex]:
+    cached = session_index_cache.get(session_id)
+    if cached is not None and not cached.expired():
+        return cached
+
+    generation = session_index_cache.generation(session_id)
+    fingerprint = await chat_model.get_chunk_fingerprint_async(session_id)
+    if _still_current(session_id, cached, fingerprint):
+        return cached
+    if fingerprint[0] == 0:
+        session_index_cache.invalidate(session_id)
+        vector_index.delete_session_index(session_id)
+        return None
+    index = await asyncio.to_thread(_load_stored_session_index, session_id, generation, fingerprint)
+    if index is not None:
+        return index
+
+    chunks = await chat_model.get_chunk_embeddings_by_session_id_async(session_id, with_text=RETRIEVAL_MODE == "hybrid")
+    return await asyncio.to_thread(_build_session_index, session_id, chunks, generation, fingerprint)
+
+
+def _rank_chunks(index: Optional[session_index_cache.SessionIndex], query_vecs: np.ndarray, top_k: int) -> List[List[tuple]]:
+    if index is None or len(index) == 0 or index.dim != query_vecs.shape[1]:
+        return [[] for _ in range(len(query_vecs))]
+    return [
+        [(index.chunks[idx]["id"], float(score)) for score, idx in zip(scores, top_indices)]
+        for scores, top_indices in index.search_batch(query_vecs, top_k)
+    ]
+
+
+def _rank_lexical(index: Optional[session_index_cache.SessionIndex], query: str, top_k: int) -> List[tuple]:
+    if index is None or index.lexical is None:
         return []
+    return [(index.chunks[pos]["id"], score) for pos, score in index.lexical.search(query, top_k)]
+
+
+def _rank_query(index: Optional[session_index_cache.SessionIndex], query: Optional[str],
+                query_vec: Optional[np.ndarray], top_k: int) -> List[tuple]:
+    # Vector-only, lexical-only (query_vec is None) or both lists fused with reciprocal rank fusion.
+    if query_vec is None:
+        _record_retrieval("lexical_only")
+        return _rank_lexical(index, query, top_k)
+    if RETRIEVAL_MODE != "hybrid" or not query or index is None or index.lexical is None:
+        _record_retrieval("vector")
+        return _rank_chunks(index, query_vec.reshape(1, -1), top_k)[0]
+    _record_retrieval("hybrid")
+    candidates = max(top_k, RETRIEVAL_CANDIDATES)
+    vector_ranked = _rank_chunks(index, query_vec.reshape(1, -1), candidates)[0]
+    lexical_ranked = _rank_lexical(index, query, candidates)
+    return lexical_index.reciprocal_rank_fusion(
+        [[chunk_id for chunk_id, _ in vector_ranked], [chunk_id for chunk_id, _ in lexical_ranked]],
+        RETRIEVAL_RRF_K,
+        top_k,
+    )
+
 
-    embeddings = np.stack(embeddings_list)
-    query_vec = np.array(query_embedding, dtype="float32")
+def _record_retrieval(kind: str):
+    with _retrieval_lock:
+        _retrieval_stats[kind] += 1
 
-    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-    query_vec = query_vec / np.linalg.norm(query_vec)
 
-    similarities = np.dot(embeddings, query_vec)
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+def search_similar_chunks(session_id: int, query_embedding: np.ndarray, top_k: int = 5, query: Optional[str] = None) -> List[Dict]:
+    results = search_similar_chunks_batch(
+        session_id, np.asarray(query_embedding).reshape(1, -1), top_k, [query] if query is not None else None
+    )
+    return results[0] if results else []
+
 
+def search_similar_chunks_batch(session_id: int, query_embeddings: np.ndarray, top_k: int = 5,
+                                queries: Optional[List[str]] = None) -> List[List[Dict]]:
+    query_vecs = vector_index.normalize_rows(query_embeddings)
+    index = load_session_index(session_id)
+    if queries is None:
+        ranked_per_query = _rank_chunks(index, query_vecs, top_k)
+    else:
+        ranked_per_query = [_rank_query(index, query, vec, top_k) for query, vec in zip(queries, query_vecs)]
+    rows_by_id = fetch_chunk_texts([chunk_id for ranked in ranked_per_query for chunk_id, _ in ranked])
+    return [hydrate_chunks(ranked, rows_by_id) for ranked in ranked_per_query]
+
+
+async def search_similar_chunks_async(session_id: int, query_embedding: Optional[np.ndarray], top_k: int = 5,
+                                      index: Optional[session_index_cache.SessionIndex] = None,
+                                      query: Optional[str] = None) -> List[Dict]:
+    # query_embedding may be None for lexical-only queries; query enables hybrid ranking.
+    if index is None:
+        index = await load_session_index_async(session_id)
+    query_vec = None
+    if query_embedding is not None:
+        query_vec = vector_index.normalize_rows(np.asarray(query_embedding).reshape(1, -1))[0]
+    ranked = _rank_query(index, query, query_vec, top_k)
+    rows = await chat_model.get_chunks_by_ids_async([chunk_id for chunk_id, _ in ranked])
+    return hydrate_chunks(ranked, {row["id"]: row for row in rows})
+
+
+def fetch_chunk_texts(chunk_ids: List[int]) -> Dict[int, Dict]:
+    # Phase two of retrieval: one in_ query for the text of every winning chunk.
+    rows = chat_model.get_chunks_by_ids(list(dict.fromkeys(chunk_ids)))
+    return {row["id"]: row for row in rows}
+
+
+def hydrate_chunks(ranked: List[tuple], rows_by_id: Optional[Dict[int, Dict]] = None) -> List[Dict]:
+    if rows_by_id is None:
+        rows_by_id = fetch_chunk_texts([chunk_id for chunk_id, _ in ranked])
     similar_chunks = []
-    for idx in top_indices:
-        chunk = valid_chunks[idx].copy()
-        chunk["similarity_score"] = float(similarities[idx])
+    for chunk_id, score in ranked:
+        row = rows_by_id.get(chunk_id)
+        if row is None:
+            continue
+        chunk = dict(row)
+        chunk["similarity_score"] = score
         similar_chunks.append(chunk)
-
     return similar_chunks
 
 
@@ -274,35 +586,61 @@ def get_query_embedding(query: str) -> np.ndarray:
     return get_embeddings([query])[0]
 
 
-def call_llm_api(prompt) -> str:
-    client_groq = Groq()
-    completion = client_groq.chat.completions.create(
-        model="openai/gpt-oss-120b",
-        messages=[{"role": "user", "content": prompt}],
+async def call_llm_api(prompt) -> str:
+    return await llm_client.complete(
+        [{"role": "user", "content": prompt}],
         temperature=0.3,
         top_p=0.9,
-        stream=False,
         max_tokens=1000,
     )
-    return completion.choices[0].message.content.strip()
 
 
-def process_user_message(session_id: int, message: str) -> Dict:
-    query_embedding = get_query_embedding(message)
-    similar_chunks = search_similar_chunks(session_id, query_embedding, top_k=3)
-
-    if similar_chunks:
-        context = "\n\n".join([
-            f"[From {chunk.get('file_name', 'unknown')}]: {chunk['text']}"
-            for chunk in similar_chunks
-        ])
-    else:
-        context = "No relevant documents were found in this session."
-
-    prompt = f"""
+async def stream_llm_api(prompt) -> AsyncIterator[str]:
+    async for delta in llm_client.stream(
+        [{"role": "user", "content": prompt}],
+        temperature=0.3,
+        top_p=0.9,
+        max_tokens=1000,
+    ):
+        yield delta
+
+
+# Part of the answer cache key: bump whenever the prompt below changes so older answers are not served.
+PROMPT_TEMPLATE_VERSION = "2"
+_ROLE_LABELS = {"user": "User", "bot": "Assistant"}
+_template_tokens: Optional[int] = None
+
+
+async def retrieve_context(session_id: int, message: str,
+                           save_user_message: bool = False) -> Tuple[Optional[np.ndarray], List[Dict]]:
+    # Returns the query embedding (None when a lexical-only query skipped it) and the retrieved chunks.
+    # The embedding call, the session index load and the user-message insert are independent; run them together.
+    # Identifier/code/quoted queries skip the embedding call when the lexical index can answer them.
+    lexical_only = RETRIEVAL_MODE == "hybrid" and lexical_index.is_lexical_query(message)
+    steps = [load_session_index_async(session_id)]
+    if not lexical_only:
+        steps.append(asyncio.to_thread(get_query_embedding, message))
+    if save_user_message:
+        steps.append(_save_message(session_id, "user", message))
+    results = await asyncio.gather(*steps)
+    index = results[0]
+    query_embedding = None if lexical_only else results[1]
+    if lexical_only and not _rank_lexical(index, message, 1):
+        query_embedding = await asyncio.to_thread(get_query_embedding, message)
+    similar_chunks = await search_similar_chunks_async(session_id, query_embedding, top_k=3, index=index, query=message)
+    return query_embedding, similar_chunks
+
+
+def _render_prompt(question: str, context: str, conversation: str) -> str:
+    if conversation:
+        conversation = f"""
+Earlier conversation (only to understand what the question refers to, not a source of facts):
+{conversation}
+"""
+    return f"""
 User asks:
-{message}
-
+{question}
+{conversation}
 From the following documents (with file names shown):
 {context}
 
@@ -314,18 +652,371 @@ Instructions:
 - If nothing is relevant, reply: "No information found in the documents."
 """
 
-    answer = call_llm_api(prompt)
-    chat_model.create_chat_message(session_id, "bot", answer)
 
-    return {"session_id": session_id, "user_message": message, "answer": answer}
+def _fixed_prompt_tokens() -> int:
+    # Template text around the variable parts, counted once with the conversation section present.
+    global _template_tokens
+    if _template_tokens is None:
+        _template_tokens = prompt_budget.count_tokens(_render_prompt("", "", " "))
+    return _template_tokens
+
+
+def _fit_question(message: str) -> str:
+    return prompt_budget.truncate(message, prompt_budget.PROMPT_TOKEN_BUDGET // 2)
+
+
+async def get_conversation_history(session_id: int, message: str) -> List[Dict]:
+    # The turns before message, from this worker's ring buffer; the database is read again once it is
+    # HISTORY_MAX_AGE_SECONDS old, so turns answered by other workers are picked up.
+    history = conversation_history.get(session_id)
+    if history is None:
+        try:
+            rows = await chat_model.get_recent_messages_async(session_id, conversation_history.HISTORY_MAX_MESSAGES)
+        except Exception as e:
+            print(f"Loading conversation history of session {session_id} failed: {e}")
+            return []
+        history = conversation_history.hydrate(session_id, rows)
+    # A client that saved the question itself before asking: it is the question, not history.
+    if history and history[-1]["role"] == "user" and history[-1]["message"].strip() == message.strip():
+        history = history[:-1]
+    return history
+
+
+def pack_history(message: str, history: List[Dict]) -> List[str]:
+    # Most recent whole turns that fit HISTORY_TOKEN_BUDGET (and whatever the question leaves of the prompt budget).
+    lines = [f"{_ROLE_LABELS.get(m['role'], m['role'])}: {m['message'].strip()}" for m in history if m["message"].strip()]
+    available = prompt_budget.PROMPT_TOKEN_BUDGET - _fixed_prompt_tokens() - prompt_budget.count_tokens(_fit_question(message))
+    budget = max(0, min(HISTORY_TOKEN_BUDGET, available))
+    return prompt_budget.take_latest(lines, budget, max_tokens_each=max(1, HISTORY_TOKEN_BUDGET // 2))
+
+
+def history_key(message: str, history: List[str]) -> str:
+    # Answer-cache key part for the conversation. Only follow-ups depend on it; standalone questions keep sharing
+    # cached answers across turns, as the window changes with every exchange.
+    if not history or not conversation_history.is_follow_up(message):
+        return ""
+    return hashlib.sha1("\n".join(history).encode("utf-8")).hexdigest()[:16]
+
+
+def format_rag_prompt(message: str, similar_chunks: List[Dict], history: Optional[List[str]] = None) -> str:
+    # Packs question, conversation and passages into PROMPT_TOKEN_BUDGET in that priority order; passages are taken
+    # by rank and the last one is shortened explicitly rather than left for the model to cut off.
+    question = _fit_question(message)
+    conversation = "\n".join(history or [])
+    remaining = (prompt_budget.PROMPT_TOKEN_BUDGET - _fixed_prompt_tokens()
+                 - prompt_budget.count_tokens(question) - prompt_budget.count_tokens(conversation))
+    passages, truncated = [], 0
+    for chunk in similar_chunks:
+        passage = f"[From {chunk.get('file_name', 'unknown')}]: {chunk['text']}"
+        tokens = prompt_budget.count_tokens(passage + "\n\n")
+        if tokens > remaining:
+            if remaining >= PROMPT_MIN_PASSAGE_TOKENS:
+                passages.append(prompt_budget.truncate(passage, remaining - 2))
+                truncated = 1
+            break
+        passages.append(passage)
+        remaining -= tokens
+    if passages:
+        context = "\n\n".join(passages)
+    else:
+        context = "No relevant documents were found in this session."
+
+    prompt = _render_prompt(question, context, conversation)
+    prompt_tokens = prompt_budget.count_tokens(prompt)
+    with _prompt_lock:
+        _prompt_stats["prompts"] += 1
+        _prompt_stats["tokens"] += prompt_tokens
+        _prompt_stats["max_tokens"] = max(_prompt_stats["max_tokens"], prompt_tokens)
+        _prompt_stats["history_messages"] += len(history or [])
+        _prompt_stats["passages_truncated"] += truncated
+        _prompt_stats["passages_dropped"] += len(similar_chunks) - len(passages)
+    return prompt
+
+
+def _semantic_answer(session_id: int, version: int, query_embedding: Optional[np.ndarray],
+                     similar_chunks: List[Dict], history_fingerprint: str) -> Optional[str]:
+    if query_embedding is None:
+        return None
+    chunk_ids = [chunk["id"] for chunk in similar_chunks]
+    return answer_cache.semantic_get(session_id, version, query_embedding, chunk_ids, PROMPT_TEMPLATE_VERSION,
+                                     history_fingerprint)
+
+
+def _remember_answer(session_id: int, version: int, message: str, query_embedding: Optional[np.ndarray],
+                     similar_chunks: List[Dict], answer: str, generated: bool, history_fingerprint: str):
+    answer_cache.put(session_id, version, message, PROMPT_TEMPLATE_VERSION, answer, history_fingerprint)
+    if generated and query_embedding is not None:
+        chunk_ids = [chunk["id"] for chunk in similar_chunks]
+        answer_cache.semantic_put(session_id, version, query_embedding, chunk_ids, PROMPT_TEMPLATE_VERSION, answer,
+                                  history_fingerprint)
+
+
+async def _cached_answer(session_id: int, message: str, version: int, history_fingerprint: str,
+                         save_user_message: bool) -> Optional[str]:
+    answer = answer_cache.get(session_id, version, message, PROMPT_TEMPLATE_VERSION, history_fingerprint)
+    if answer is not None and save_user_message:
+        await _save_message(session_id, "user", message)
+    return answer
+
+
+async def process_user_message(session_id: int, message: str, save_user_message: bool = False) -> Dict:
+    version = answer_cache.document_version(session_id)
+    # Read before the question itself is saved, so it only holds the earlier turns.
+    history = pack_history(message, await get_conversation_history(session_id, message))
+    fingerprint = history_key(message, history)
+    answer = await _cached_answer(session_id, message, version, fingerprint, save_user_message)
+    cached = answer is not None
+    if not cached:
+        query_embedding, similar_chunks = await retrieve_context(session_id, message, save_user_message)
+        # Paraphrases of an earlier question that retrieved the same chunks reuse its answer.
+        answer = _semantic_answer(session_id, version, query_embedding, similar_chunks, fingerprint)
+        cached = answer is not None
+        if not cached:
+            answer = await call_llm_api(format_rag_prompt(message, similar_chunks, history))
+        _remember_answer(session_id, version, message, query_embedding, similar_chunks, answer,
+                         generated=not cached, history_fingerprint=fingerprint)
+    await _save_message(session_id, "bot", answer)
+
+    return {"session_id": session_id, "user_message": message, "answer": answer, "cached": cached}
+
+
+def _sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_user_message(session_id: int, message: str, save_user_message: bool = False) -> AsyncIterator[str]:
+    # Retrieval runs before the response starts so its failures still surface as normal HTTP errors.
+    version = answer_cache.document_version(session_id)
+    history = pack_history(message, await get_conversation_history(session_id, message))
+    fingerprint = history_key(message, history)
+    cached_answer = await _cached_answer(session_id, message, version, fingerprint, save_user_message)
+    prompt = None
+    if cached_answer is None:
+        query_embedding, similar_chunks = await retrieve_context(session_id, message, save_user_message)
+        cached_answer = _semantic_answer(session_id, version, query_embedding, similar_chunks, fingerprint)
+        if cached_answer is not None:
+            _remember_answer(session_id, version, message, query_embedding, similar_chunks, cached_answer,
+                             generated=False, history_fingerprint=fingerprint)
+        else:
+            prompt = format_rag_prompt(message, similar_chunks, history)
+
+    async def events() -> AsyncIterator[str]:
+        if cached_answer is not None:
+            answer = cached_answer
+            yield _sse_event("delta", {"content": answer})
+        else:
+            parts = []
+            try:
+                async for delta in stream_llm_api(prompt):
+                    parts.append(delta)
+                    yield _sse_event("delta", {"content": delta})
+            except Exception as e:
+                print(f"Error while streaming LLM response: {e}")
+                yield _sse_event("error", {"detail": "LLM streaming failed"})
+                return
+            answer = "".join(parts).strip()
+            _remember_answer(session_id, version, message, query_embedding, similar_chunks, answer,
+                             generated=True, history_fingerprint=fingerprint)
+        saved = await _save_message(session_id, "bot", answer)
+        yield _sse_event("done", {
+            "session_id": session_id,
+            "user_message": message,
+            "answer": answer,
+            "message_id": saved.get("id") if saved else None,
+            "cached": cached_answer is not None,
+        })
+
+    return events()
+
+
+def start_embedding_warmup():
+    embedding_provider.start_background_warmup()
+
+
+def shutdown():
+    # Stops the OCR worker processes; they are spawned on first use and would otherwise outlive the app.
+    pdf_extraction.shutdown()
+
+
+def get_readiness() -> Dict:
+    embedder = embedding_provider.status()
+    return {"ok": embedder["ready"], "embedder": embedder}
+
+
+def _retrieval_snapshot() -> Dict:
+    with _retrieval_lock:
+        snapshot = dict(_retrieval_stats)
+    snapshot["mode"] = RETRIEVAL_MODE
+    return snapshot
+
+
+def _prompt_snapshot() -> Dict:
+    with _prompt_lock:
+        snapshot = dict(_prompt_stats)
+    snapshot["avg_tokens"] = snapshot["tokens"] / snapshot["prompts"] if snapshot["prompts"] else 0.0
+    snapshot["budget"] = prompt_budget.PROMPT_TOKEN_BUDGET
+    snapshot["history_budget"] = HISTORY_TOKEN_BUDGET
+    snapshot["tokenizer"] = prompt_budget.tokenizer_name()
+    return snapshot
+
+
+def get_metrics() -> Dict:
+    return {
+        "llm": llm_client.get_metrics(),
+        "session_index_cache": session_index_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "ingestion": ingestion_jobs.stats(),
+        "retrieval": _retrieval_snapshot(),
+        "answer_cache": answer_cache.stats(),
+        "prompt": _prompt_snapshot(),
+        "conversation_history": conversation_history.stats(),
+    }
+
+
+def _forget_session(session_id: int):
+    session_index_cache.invalidate(session_id)
+    answer_cache.invalidate_session(session_id)
+    conversation_history.invalidate(session_id)
+    vector_index.delete_session_index(session_id)
 
 
 def delete_chat_session_by_id(session_id: int) -> bool:
-    return chat_model.delete_chat_session(session_id)
+    deleted = chat_model.delete_chat_session(session_id)
+    _forget_session(session_id)
+    return deleted
+
+
+def delete_chat_sessions_by_ids(user_id: int, session_ids: List[int]) -> Dict:
+    if len(session_ids) > BULK_DELETE_MAX_SESSIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_DELETE_MAX_SESSIONS} sessions can be deleted at once")
+    deleted = chat_model.delete_chat_sessions(session_ids, user_id=user_id)
+    for session_id in deleted:
+        _forget_session(session_id)
+    return {"deleted": deleted}
 
 
 def delete_file_from_session(file_id: int) -> bool:
-    return chat_model.delete_file_from_session(file_id)
+    session_ids = chat_model.get_session_ids_by_file_id(file_id)
+    deleted = chat_model.delete_file_from_session(file_id)
+    session_index_cache.remove_file(file_id)
+    for session_id in session_ids:
+        answer_cache.invalidate_session(session_id)
+        index = session_index_cache.get(session_id)
+        if index is not None:
+            persist_session_index(session_id, index)
+        else:
+            vector_index.delete_session_index(session_id)
+    return deleted
+
+
+class _BufferedUploadFile:
+    def __init__(self, filename: str, content_type: str, content_bytes: bytes):
+        self.filename = filename
+        self.content = content_bytes
+        self.content_hash = hashlib.sha256(content_bytes).hexdigest()
+        self.file = type('F', (), {'read': lambda self2: content_bytes})()
+        self.content_type = content_type
+
+
+def _store_upload(job: Dict, user_id: int, session_id: int, upload: _BufferedUploadFile) -> Dict:
+    res = chat_model.upload_file(user_id, upload, content_hash=upload.content_hash)
+    if not res or "id" not in res:
+        raise HTTPException(status_code=500, detail="File upload failed")
+    # Recorded before linking so a failed link is still cleaned up with the job.
+    job["file_id"] = res["id"]
+
+    linked = chat_model.link_file_to_session(session_id, res["id"])
+    if not linked:
+        raise HTTPException(status_code=500, detail="Failed to link file to session")
+    job["upload_result"] = res
+    return res
+
+
+def _link_duplicate(job: Dict, user_id: int, session_id: int, upload: _BufferedUploadFile,
+                    embedding_model_name: str, report: Callable) -> Optional[Dict]:
+    # Identical bytes already embedded with this model: reuse the stored object and copy its chunks and vectors.
+    source = chat_model.find_indexed_file_by_content_hash(upload.content_hash, embedding_model_name)
+    if not source:
+        return None
+
+    report("linking", 0.2)
+    res = chat_model.create_file_record(
+        user_id, upload.filename, source["file_url"], upload.content_type, len(upload.content), upload.content_hash
+    )
+    if not res or res.get("id") is None:
+        raise HTTPException(status_code=500, detail="File upload failed")
+    job["file_id"] = res["id"]
+    if not chat_model.link_file_to_session(session_id, res["id"]):
+        raise HTTPException(status_code=500, detail="Failed to link file to session")
+    job["upload_result"] = res
+
+    report("copying", 0.5)
+    rows = chat_model.copy_file_chunks(source["id"], session_id, res["id"], upload.filename)
+    if not rows:
+        # The source lost its chunks in the meantime; the caller indexes this file from its bytes instead.
+        return None
+
+    report("indexing", 0.95)
+    add_chunks_to_session_index(
+        session_id,
+        np.stack(embedding_codec.decode_embeddings(rows)),
+        [{"id": row["id"], "file_id": res["id"]} for row in rows],
+        [row["text"] for row in rows],
+    )
+    chat_model.mark_file_indexed(res["id"], embedding_model_name)
+    return res
+
+
+def _ingest_file(job: Dict, user_id: int, session_id: int, upload: _BufferedUploadFile, report: Callable) -> Dict:
+    embedding_model_name = embedding_provider.get_provider().model_name
+    if job.get("file_id") is None:
+        reused = _link_duplicate(job, user_id, session_id, upload, embedding_model_name, report)
+        if reused is not None:
+            return reused
+
+    upload_future = None
+    if job.get("upload_result") is None:
+        if job.get("file_id") is not None:
+            delete_file_from_session(job.pop("file_id"))
+        report("uploading", 0.05)
+        # Storage upload and the files/session_files inserts run while the bytes are parsed and embedded.
+        upload_future = _upload_executor.submit(_store_upload, job, user_id, session_id, upload)
+    else:
+        # A previous attempt stored and linked the file; only redo indexing. Chunk batches it already wrote
+        # are upserted over, so they need no cleanup.
+        session_index_cache.remove_file(job["file_id"])
+
+    try:
+        report("extracting", 0.15)
+        pages = iter_document_pages(upload.filename, upload.content)
+        embedded = embed_chunk_stream(chunking.iter_chunks(pages)) if pages is not None else iter(())
+        # The first batches are extracted and embedded while the storage upload (which assigns file_id) runs;
+        # the rest stream straight into the chunk writer.
+        first = next(embedded, None)
+    finally:
+        if upload_future is not None:
+            upload_future.result()
+
+    if pages is None:
+        raise HTTPException(status_code=415, detail="Unsupported file type")
+    if first is None:
+        raise HTTPException(status_code=422, detail="No text could be extracted from the file")
+
+    seen, stored = store_file_chunks(
+        session_id, job["file_id"], upload.filename, itertools.chain([first], embedded), embedding_model_name, report
+    )
+    if not stored:
+        raise HTTPException(status_code=500, detail="Failed to create FAISS index / file chunks")
+    if stored == seen:
+        # Only complete artefacts are offered for reuse by later uploads of the same bytes.
+        chat_model.mark_file_indexed(job["file_id"], embedding_model_name)
+
+    return job["upload_result"]
+
+
+def _cleanup_failed_ingestion(job: Dict):
+    if job.get("file_id") is not None:
+        delete_file_from_session(job["file_id"])
 
 
 def upload_file(user_id: int, session_id: int, uploaded_file: UploadFile) -> Dict:
@@ -336,25 +1027,23 @@ def upload_file(user_id: int, session_id: int, uploaded_file: UploadFile) -> Dic
     if len(content) > MAX_FILE_SIZE_BYTES:
         raise HTTPException(status_code=413, detail="File too large. Maximum allowed size is 20 MB")
 
-    class _PatchedUploadFile:
-        def __init__(self, original: UploadFile, content_bytes: bytes):
-            self.filename = original.filename
-            self.file = type('F', (), {'read': lambda self2: content_bytes})()
-            self.content_type = original.content_type
-
-    patched_upload = _PatchedUploadFile(uploaded_file, content)
-    res = chat_model.upload_file(user_id, patched_upload)
-    if not res or "id" not in res:
-        raise HTTPException(status_code=500, detail="File upload failed")
+    upload = _BufferedUploadFile(uploaded_file.filename, uploaded_file.content_type, content)
+    return ingestion_jobs.submit(
+        user_id,
+        session_id,
+        uploaded_file.filename,
+        lambda job, report: _ingest_file(job, user_id, session_id, upload, report),
+        on_failure=_cleanup_failed_ingestion,
+        size=len(content),
+    )
 
-    file_id = res["id"]
 
-    linked = chat_model.link_file_to_session(session_id, file_id)
-    if not linked:
-        raise HTTPException(status_code=500, detail="Failed to link file to session")
+def get_ingestion_job(job_id: str, user_id: int) -> Dict:
+    job = ingestion_jobs.get_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
 
-    faiss_created = create_faiss_index_for_file(session_id, file_id)
-    if not faiss_created:
-        raise HTTPException(status_code=500, detail="Failed to create FAISS index / file chunks")
 
-    return res
\ No newline at end of file
+def get_ingestion_jobs(user_id: int, session_id: Optional[int] = None) -> List[Dict]:
+    return ingestion_jobs.list_jobs(user_id, session_id)
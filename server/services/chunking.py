@@ -0,0 +1,104 @@
+import os
+import re
+from collections import deque
+from typing import Optional, Dict, List, Iterable, Iterator, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# words: fixed windows of CHUNK_SIZE words; sentences: whole sentences packed up to CHUNK_SIZE words
+CHUNK_MODE = os.getenv("CHUNK_MODE", "words").lower()
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 200))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 20))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s+")
+
+
+def _make_chunk(words: List[Tuple[str, int]]) -> Dict:
+    return {
+        "text": " ".join(word for word, _ in words),
+        "page_start": words[0][1],
+        "page_end": words[-1][1],
+    }
+
+
+def _iter_words(pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, int]]:
+    for page_num, text in pages:
+        for match in re.finditer(r"\S+", text or ""):
+            yield match.group(), page_num
+
+
+def iter_word_chunks(pages: Iterable[Tuple[int, str]], chunk_size: int, overlap: int) -> Iterator[Dict]:
+    window: deque = deque()
+    fresh = 0
+    for word in _iter_words(pages):
+        window.append(word)
+        fresh += 1
+        if len(window) == chunk_size:
+            yield _make_chunk(list(window))
+            for _ in range(chunk_size - overlap):
+                window.popleft()
+            fresh = 0
+    if fresh:
+        yield _make_chunk(list(window))
+
+
+def _iter_sentences(pages: Iterable[Tuple[int, str]]) -> Iterator[List[Tuple[str, int]]]:
+    # A sentence can run across a page break; it is attributed word by word to the pages it spans.
+    pending: List[Tuple[str, int]] = []
+    for page_num, text in pages:
+        parts = _SENTENCE_END.split(text or "")
+        for i, part in enumerate(parts):
+            pending.extend((word, page_num) for word in part.split())
+            if i < len(parts) - 1 and pending:
+                yield pending
+                pending = []
+    if pending:
+        yield pending
+
+
+def iter_sentence_chunks(pages: Iterable[Tuple[int, str]], chunk_size: int, overlap: int) -> Iterator[Dict]:
+    current: List[List[Tuple[str, int]]] = []
+    current_words = 0
+    fresh = False
+    for sentence in _iter_sentences(pages):
+        if len(sentence) > chunk_size:
+            # Overlong sentences fall back to word windows so no chunk exceeds the size limit.
+            if fresh:
+                yield _make_chunk([w for s in current for w in s])
+            current, current_words, fresh = [], 0, False
+            yield from iter_word_chunks(_words_as_pages(sentence), chunk_size, overlap)
+            continue
+        if current_words + len(sentence) > chunk_size and current:
+            yield _make_chunk([w for s in current for w in s])
+            # Carry trailing whole sentences that fit in the overlap budget.
+            carried: List[List[Tuple[str, int]]] = []
+            carried_words = 0
+            for s in reversed(current):
+                if carried_words + len(s) > overlap or carried_words + len(s) + len(sentence) > chunk_size:
+                    break
+                carried.insert(0, s)
+                carried_words += len(s)
+            current, current_words = carried, carried_words
+        current.append(sentence)
+        current_words += len(sentence)
+        fresh = True
+    if fresh and current:
+        yield _make_chunk([w for s in current for w in s])
+
+
+def _words_as_pages(words: List[Tuple[str, int]]) -> Iterator[Tuple[int, str]]:
+    for word, page_num in words:
+        yield page_num, word
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], chunk_size: Optional[int] = None,
+                overlap: Optional[int] = None, mode: Optional[str] = None) -> Iterator[Dict]:
+    # Lazily turns (page_number, text) pairs into {"text", "page_start", "page_end"} chunks.
+    chunk_size = chunk_size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    overlap = max(0, min(overlap, chunk_size - 1))
+    mode = mode or CHUNK_MODE
+    if mode == "sentences":
+        return iter_sentence_chunks(pages, chunk_size, overlap)
+    return iter_word_chunks(pages, chunk_size, overlap)
@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Optional, Dict, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Messages of the latest conversation turns kept per session for prompting (a turn is a user message and a reply).
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", 4))
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", 1024))
+HISTORY_MAX_MESSAGES = 2 * HISTORY_TURNS
+# Turns answered by other workers only reach the buffer from the database; older buffers are read again.
+HISTORY_MAX_AGE_SECONDS = float(os.getenv("HISTORY_MAX_AGE_SECONDS", 30))
+
+
+# Words that point back into the conversation ("what about the second one?", "nó", "còn cái đó?").
+_REFERRING = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she", "him", "her", "one", "ones",
+    "above", "previous", "earlier", "former", "latter", "same", "again", "else", "more", "other",
+    "nó", "đó", "này", "kia", "ấy", "trên", "vậy", "thế", "tiếp",
+}
+_CONTINUATIONS = ("and ", "but ", "so ", "also ", "then ", "what about", "how about", "why", "còn ", "vậy ", "thế ", "và ")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def is_follow_up(question: str) -> bool:
+    # Conservative: a standalone question misread as a follow-up only costs an answer-cache miss.
+    text = question.strip().lower()
+    words = _WORD.findall(text)
+    if len(words) <= 2 or text.startswith(_CONTINUATIONS):
+        return True
+    return any(word in _REFERRING for word in words)
+
+
+class _Buffer:
+    def __init__(self):
+        self.messages: deque = deque(maxlen=HISTORY_MAX_MESSAGES)
+        # time.monotonic() of the last read from the database; None until the first one.
+        self.hydrated_at: Optional[float] = None
+
+    def fresh(self) -> bool:
+        return self.hydrated_at is not None and time.monotonic() - self.hydrated_at <= HISTORY_MAX_AGE_SECONDS
+
+
+# session_id -> ring buffer of {"id", "role", "message"}, oldest first; least recently used sessions are dropped
+_buffers: "OrderedDict[int, _Buffer]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "hydrations": 0, "evictions": 0}
+
+
+def _entry(message: Dict) -> Dict:
+    return {"id": message.get("id"), "role": message.get("role"), "message": message.get("message") or ""}
+
+
+def _buffer(session_id: int) -> _Buffer:
+    buffer = _buffers.get(session_id)
+    if buffer is None:
+        buffer = _buffers[session_id] = _Buffer()
+        while len(_buffers) > HISTORY_MAX_SESSIONS:
+            _buffers.popitem(last=False)
+            _stats["evictions"] += 1
+    _buffers.move_to_end(session_id)
+    return buffer
+
+
+def get(session_id: int) -> Optional[List[Dict]]:
+    # None until the session was hydrated from the database on this worker, and again once that is
+    # HISTORY_MAX_AGE_SECONDS old.
+    if HISTORY_MAX_MESSAGES <= 0:
+        return []
+    with _lock:
+        buffer = _buffers.get(session_id)
+        if buffer is None or not buffer.fresh():
+            return None
+        _buffers.move_to_end(session_id)
+        _stats["hits"] += 1
+        return list(buffer.messages)
+
+
+def hydrate(session_id: int, messages: List[Dict]) -> List[Dict]:
+    # messages: the latest rows from chat_messages. Messages appended while they were being fetched are merged
+    # in by id, so a concurrent insert is neither lost nor duplicated.
+    with _lock:
+        buffer = _buffer(session_id)
+        if not buffer.fresh():
+            merged = {m["id"]: m for m in map(_entry, messages)}
+            for m in buffer.messages:
+                merged.setdefault(m["id"], m)
+            buffer.messages.clear()
+            buffer.messages.extend(sorted(merged.values(), key=lambda m: m["id"] or 0))
+            buffer.hydrated_at = time.monotonic()
+            _stats["hydrations"] += 1
+        return list(buffer.messages)
+
+
+def append(session_id: int, message: Dict):
+    if HISTORY_MAX_MESSAGES <= 0 or not message:
+        return
+    with _lock:
+        _buffer(session_id).messages.append(_entry(message))
+
+
+def invalidate(session_id: int):
+    with _lock:
+        _buffers.pop(session_id, None)
+
+
+def stats() -> Dict:
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["sessions"] = len(_buffers)
+    snapshot["turns"] = HISTORY_TURNS
+    snapshot["max_age_seconds"] = HISTORY_MAX_AGE_SECONDS
+    return snapshot
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 20000))
+# Set to a sqlite file path to keep embeddings across restarts; empty disables the disk tier.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+_memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_lock = threading.Lock()
+_db: Optional[sqlite3.Connection] = None
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def cache_key(text: str, namespace: str) -> str:
+    return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _get_db() -> Optional[sqlite3.Connection]:
+    global _db
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    if _db is None:
+        os.makedirs(os.path.dirname(os.path.abspath(EMBEDDING_CACHE_PATH)), exist_ok=True)
+        _db = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+        )
+    return _db
+
+
+def _remember_locked(key: str, vector: np.ndarray):
+    _memory[key] = vector
+    _memory.move_to_end(key)
+    while len(_memory) > EMBEDDING_CACHE_MAX_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def get_many(texts: List[str], namespace: str) -> List[Optional[np.ndarray]]:
+    keys = [cache_key(text, namespace) for text in texts]
+    results: List[Optional[np.ndarray]] = [None] * len(texts)
+    disk_lookups: Dict[str, List[int]] = {}
+    with _lock:
+        for i, key in enumerate(keys):
+            vector = _memory.get(key)
+            if vector is not None:
+                _memory.move_to_end(key)
+                results[i] = vector
+                _stats["memory_hits"] += 1
+            else:
+                disk_lookups.setdefault(key, []).append(i)
+
+        db = _get_db() if disk_lookups else None
+        if db is not None:
+            lookup_keys = list(disk_lookups)
+            for start in range(0, len(lookup_keys), 500):
+                batch = lookup_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    _remember_locked(key, vector)
+                    for i in disk_lookups.pop(key):
+                        results[i] = vector
+                        _stats["disk_hits"] += 1
+
+        _stats["misses"] += sum(len(positions) for positions in disk_lookups.values())
+    return results
+
+
+def put_many(texts: List[str], vectors, namespace: str):
+    entries = []
+    with _lock:
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                continue
+            vector = np.asarray(vector, dtype=np.float32)
+            key = cache_key(text, namespace)
+            _remember_locked(key, vector)
+            entries.append((key, namespace, int(vector.shape[0]), vector.tobytes()))
+        db = _get_db() if entries else None
+        if db is not None:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO embeddings (key, namespace, dim, vector) VALUES (?, ?, ?, ?)", entries)
+
+
+def stats() -> Dict:
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["entries"] = len(_memory)
+    lookups = snapshot["memory_hits"] + snapshot["disk_hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = (snapshot["memory_hits"] + snapshot["disk_hits"]) / lookups if lookups else 0.0
+    snapshot["disk_enabled"] = bool(EMBEDDING_CACHE_PATH)
+    return snapshot
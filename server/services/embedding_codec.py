@@ -0,0 +1,70 @@
+import os
+import json
+import base64
+from typing import Optional, Dict, List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# float32 | float16 | int8
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float16").lower()
+# Keep writing the pgvector column for deployments that still query it server-side.
+EMBEDDING_WRITE_LEGACY_COLUMN = os.getenv("EMBEDDING_WRITE_LEGACY_COLUMN", "false").lower() == "true"
+
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def encode_embedding(emb: np.ndarray, dtype: str = EMBEDDING_STORAGE_DTYPE) -> Dict:
+    vec = np.asarray(emb, dtype=np.float32)
+    scale = None
+    if dtype == "int8":
+        max_abs = float(np.max(np.abs(vec))) if vec.size else 0.0
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+        packed = np.clip(np.rint(vec / scale), -127, 127).astype(np.int8)
+    else:
+        packed = vec.astype(_DTYPES[dtype])
+    record = {
+        "embedding_b64": base64.b64encode(packed.tobytes()).decode("ascii"),
+        "embedding_dtype": dtype,
+        "embedding_scale": scale,
+    }
+    if EMBEDDING_WRITE_LEGACY_COLUMN:
+        record["embedding"] = vec.tolist()
+    return record
+
+
+def _decode_legacy(emb) -> np.ndarray:
+    # pgvector rows come back over PostgREST as "[0.1,0.2,...]", which is valid JSON.
+    if isinstance(emb, str):
+        emb = json.loads(emb)
+    return np.asarray(emb, dtype=np.float32)
+
+
+def decode_embedding(row: Dict) -> Optional[np.ndarray]:
+    encoded = row.get("embedding_b64")
+    if encoded:
+        dtype = row.get("embedding_dtype") or "float32"
+        vec = np.frombuffer(base64.b64decode(encoded), dtype=_DTYPES[dtype])
+        if dtype == "int8":
+            return vec.astype(np.float32) * np.float32(row.get("embedding_scale") or 1.0)
+        return vec if dtype == "float32" else vec.astype(np.float32)
+    legacy = row.get("embedding")
+    if legacy is None:
+        return None
+    return _decode_legacy(legacy)
+
+
+def decode_embeddings(rows: List[Dict]) -> List[Optional[np.ndarray]]:
+    # Rows that share a float dtype are decoded with a single frombuffer over the joined payload.
+    dtypes = {row.get("embedding_dtype") for row in rows if row.get("embedding_b64")}
+    if len(dtypes) == 1 and all(row.get("embedding_b64") for row in rows):
+        dtype = dtypes.pop() or "float32"
+        if dtype != "int8":
+            raw = [base64.b64decode(row["embedding_b64"]) for row in rows]
+            if len({len(r) for r in raw}) == 1:
+                matrix = np.frombuffer(b"".join(raw), dtype=_DTYPES[dtype]).reshape(len(raw), -1)
+                if dtype != "float32":
+                    matrix = matrix.astype(np.float32)
+                return list(matrix)
+    return [decode_embedding(row) for row in rows]
@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+from typing import Dict, List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# gradio | local
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gradio").lower()
+EMBEDDING_GRADIO_SPACE = os.getenv("EMBEDDING_GRADIO_SPACE", "BienKieu/sentence-embedding")
+EMBEDDING_LOCAL_MODEL = os.getenv("EMBEDDING_LOCAL_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# torch | onnx (onnx needs sentence-transformers[onnx])
+EMBEDDING_LOCAL_BACKEND = os.getenv("EMBEDDING_LOCAL_BACKEND", "torch").lower()
+EMBEDDING_LOCAL_BATCH_SIZE = int(os.getenv("EMBEDDING_LOCAL_BATCH_SIZE", 32))
+EMBEDDING_LOCAL_THREADS = int(os.getenv("EMBEDDING_LOCAL_THREADS", os.cpu_count() or 1))
+MAX_RETRIES = 10
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "true").lower() == "true"
+# After a failed load, requests fail fast for this long instead of re-running the retry loop.
+EMBEDDING_RETRY_COOLDOWN_SECONDS = float(os.getenv("EMBEDDING_RETRY_COOLDOWN_SECONDS", 30))
+
+
+class GradioEmbeddingProvider:
+    name = "gradio"
+    model_name = "all-MiniLM-L6-v2"
+    # Remote calls are I/O bound, so batches can be sent in parallel.
+    parallel_batches = True
+
+    def __init__(self):
+        self.client = None
+
+    def load(self):
+        from gradio_client import Client as GradioClient
+        retries = 0
+        while retries < MAX_RETRIES and self.client is None:
+            try:
+                self.client = GradioClient(EMBEDDING_GRADIO_SPACE)
+
+                self.client.predict("Test")
+            except Exception as e:
+                print(f"Gradio client load failed ({retries+1}/{MAX_RETRIES}):", e)
+                self.client = None
+                retries += 1
+                time.sleep(1)
+        if self.client is None:
+            print("Failed to load Gradio client after retries")
+
+    @property
+    def ready(self) -> bool:
+        return self.client is not None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self.client is None:
+            raise RuntimeError("Gradio client is not available")
+        return np.asarray(self.client.predict(texts), dtype=np.float32)
+
+
+class LocalEmbeddingProvider:
+    name = "local"
+    model_name = EMBEDDING_LOCAL_MODEL.rstrip("/").split("/")[-1]
+    # The model already uses every core it is given; parallel batches would only contend for them.
+    parallel_batches = False
+
+    def __init__(self):
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            print("Local embedding provider needs sentence-transformers:", e)
+            return
+        try:
+            torch.set_num_threads(EMBEDDING_LOCAL_THREADS)
+            kwargs = {"device": "cpu"}
+            if EMBEDDING_LOCAL_BACKEND != "torch":
+                kwargs["backend"] = EMBEDDING_LOCAL_BACKEND
+            self.model = SentenceTransformer(EMBEDDING_LOCAL_MODEL, **kwargs)
+        except Exception as e:
+            print("Local embedding model load failed:", e)
+            self.model = None
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self.model is None:
+            raise RuntimeError("Local embedding model is not available")
+        # One encode at a time: concurrent calls would oversubscribe the intra-op thread pool.
+        with self._lock:
+            return np.asarray(
+                self.model.encode(texts, batch_size=EMBEDDING_LOCAL_BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False),
+                dtype=np.float32,
+            )
+
+
+_PROVIDERS = {
+    "gradio": GradioEmbeddingProvider,
+    "local": LocalEmbeddingProvider,
+}
+
+_provider = None
+_load_lock = threading.Lock()
+_state = {"status": "cold", "error": None, "loaded_at": None, "failed_at": None, "load_seconds": None}
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        provider_cls = _PROVIDERS.get(EMBEDDING_PROVIDER)
+        if provider_cls is None:
+            raise ValueError(f"Unknown EMBEDDING_PROVIDER: {EMBEDDING_PROVIDER}")
+        _provider = provider_cls()
+    return _provider
+
+
+def ensure_loaded():
+    provider = get_provider()
+    if provider.ready:
+        return provider
+    with _load_lock:
+        if provider.ready:
+            return provider
+        failed_at = _state["failed_at"]
+        if failed_at is not None and time.time() - failed_at < EMBEDDING_RETRY_COOLDOWN_SECONDS:
+            return provider
+        _state.update(status="loading", error=None)
+        started = time.perf_counter()
+        try:
+            provider.load()
+        except Exception as e:
+            print("Embedding provider load failed:", e)
+            _state["error"] = str(e)
+        _state["load_seconds"] = round(time.perf_counter() - started, 3)
+        if provider.ready:
+            _state.update(status="ready", error=None, loaded_at=time.time(), failed_at=None)
+        else:
+            _state.update(status="failed", failed_at=time.time())
+            _state["error"] = _state["error"] or "provider did not become ready"
+    return provider
+
+
+def start_background_warmup():
+    if not EMBEDDING_WARMUP or get_provider().ready:
+        return
+    threading.Thread(target=ensure_loaded, name="embedding-warmup", daemon=True).start()
+
+
+def status() -> Dict:
+    provider = get_provider()
+    return {"provider": provider.name, "model": provider.model_name, "ready": provider.ready, **_state}
@@ -0,0 +1,175 @@
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Callable
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 4))
+INGESTION_MAX_RUNNING_PER_USER = int(os.getenv("INGESTION_MAX_RUNNING_PER_USER", 2))
+INGESTION_MAX_QUEUED_PER_USER = int(os.getenv("INGESTION_MAX_QUEUED_PER_USER", 20))
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", 2))
+INGESTION_JOB_TTL_SECONDS = int(os.getenv("INGESTION_JOB_TTL_SECONDS", 3600))
+# Upload bytes held by queued and running jobs across all users; further uploads get 503 until some finish.
+INGESTION_MAX_QUEUED_BYTES = int(os.getenv("INGESTION_MAX_QUEUED_BYTES", 256 * 1024 * 1024))
+# Serverless platforms (Vercel sets VERCEL=1) freeze the instance once the response is sent and route polls to
+# other instances, so jobs run to completion inside the upload request there.
+INGESTION_INLINE = os.getenv("INGESTION_INLINE", "true" if os.getenv("VERCEL") else "false").lower() == "true"
+
+# Job states: queued -> running -> succeeded | failed (running -> queued again on a retry)
+_jobs: Dict[str, Dict] = {}
+_tasks: Dict[str, Callable] = {}
+_failure_handlers: Dict[str, Callable] = {}
+_pending: Dict[int, deque] = {}
+_running: Dict[int, int] = {}
+_queued_bytes = 0
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+
+_PUBLIC_FIELDS = ("id", "status", "stage", "progress", "attempts", "error", "result", "session_id", "filename", "created_at", "updated_at")
+
+
+def _public(job: Dict) -> Dict:
+    return {k: job.get(k) for k in _PUBLIC_FIELDS}
+
+
+def _purge_expired_locked():
+    cutoff = time.time() - INGESTION_JOB_TTL_SECONDS
+    for job_id in [jid for jid, job in _jobs.items() if job["status"] in ("succeeded", "failed") and job["updated_at"] < cutoff]:
+        del _jobs[job_id]
+
+
+def _start_locked(job_id: str):
+    job = _jobs[job_id]
+    _running[job["user_id"]] = _running.get(job["user_id"], 0) + 1
+    if not INGESTION_INLINE:
+        _executor.submit(_run, job_id)
+
+
+def submit(user_id: int, session_id: int, filename: str, task: Callable, on_failure: Optional[Callable] = None,
+           size: int = 0) -> Dict:
+    # task(job, report) runs the pipeline; report(stage, progress) updates what pollers see.
+    # on_failure(job) runs once after the last attempt fails, to clean up partial work.
+    # size is the upload's byte count, held against INGESTION_MAX_QUEUED_BYTES until the job finishes.
+    # With INGESTION_INLINE the job runs in the calling thread and is returned finished.
+    global _queued_bytes
+    with _lock:
+        _purge_expired_locked()
+        queued = len(_pending.get(user_id, ()))
+        if queued >= INGESTION_MAX_QUEUED_PER_USER:
+            raise HTTPException(status_code=429, detail="Too many uploads in progress. Please wait for some to finish")
+        if _queued_bytes and _queued_bytes + size > INGESTION_MAX_QUEUED_BYTES:
+            raise HTTPException(status_code=503, detail="Server is busy processing uploads. Please try again shortly")
+        _queued_bytes += size
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        _jobs[job_id] = {
+            "id": job_id,
+            "user_id": user_id,
+            "session_id": session_id,
+            "filename": filename,
+            "size": size,
+            "status": "queued",
+            "stage": "queued",
+            "progress": 0.0,
+            "attempts": 0,
+            "error": None,
+            "result": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        _tasks[job_id] = task
+        if on_failure is not None:
+            _failure_handlers[job_id] = on_failure
+        if INGESTION_INLINE or _running.get(user_id, 0) < INGESTION_MAX_RUNNING_PER_USER:
+            _start_locked(job_id)
+        else:
+            _pending.setdefault(user_id, deque()).append(job_id)
+        if not INGESTION_INLINE:
+            return _public(_jobs[job_id])
+    _run(job_id)
+    with _lock:
+        return _public(_jobs[job_id])
+
+
+def _update(job_id: str, **fields):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields, updated_at=time.time())
+
+
+def _run(job_id: str):
+    global _queued_bytes
+    with _lock:
+        job = _jobs[job_id]
+        task = _tasks[job_id]
+    user_id = job["user_id"]
+
+    def report(stage: str, progress: float):
+        _update(job_id, stage=stage, progress=round(progress, 3))
+
+    try:
+        while True:
+            _update(job_id, status="running", attempts=job["attempts"] + 1, error=None)
+            try:
+                result = task(job, report)
+                _update(job_id, status="succeeded", stage="done", progress=1.0, result=result)
+                break
+            except Exception as e:
+                retryable = not (isinstance(e, HTTPException) and e.status_code < 500)
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                print(f"Ingestion job {job_id} attempt {job['attempts']} failed: {detail}")
+                if not retryable or job["attempts"] >= INGESTION_MAX_ATTEMPTS:
+                    on_failure = _failure_handlers.get(job_id)
+                    if on_failure is not None:
+                        try:
+                            on_failure(job)
+                        except Exception as cleanup_error:
+                            print(f"Ingestion job {job_id} cleanup failed: {cleanup_error}")
+                    _update(job_id, status="failed", error=detail)
+                    break
+                _update(job_id, status="queued", stage="retrying", error=detail)
+                time.sleep(min(2 ** job["attempts"], 10))
+    finally:
+        with _lock:
+            _queued_bytes = max(0, _queued_bytes - job.get("size", 0))
+            _tasks.pop(job_id, None)
+            _failure_handlers.pop(job_id, None)
+            _running[user_id] = max(0, _running.get(user_id, 1) - 1)
+            pending = _pending.get(user_id)
+            if pending:
+                _start_locked(pending.popleft())
+            if not pending:
+                _pending.pop(user_id, None)
+            if not _running[user_id]:
+                del _running[user_id]
+
+
+def get_job(job_id: str, user_id: int) -> Optional[Dict]:
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["user_id"] != user_id:
+            return None
+        return _public(job)
+
+
+def list_jobs(user_id: int, session_id: Optional[int] = None) -> List[Dict]:
+    with _lock:
+        return [
+            _public(job) for job in _jobs.values()
+            if job["user_id"] == user_id and (session_id is None or job["session_id"] == session_id)
+        ]
+
+
+def stats() -> Dict:
+    with _lock:
+        by_status: Dict[str, int] = {}
+        for job in _jobs.values():
+            by_status[job["status"]] = by_status.get(job["status"], 0) + 1
+        return {"workers": INGESTION_WORKERS, "inline": INGESTION_INLINE, "queued_bytes": _queued_bytes, "jobs": by_status}
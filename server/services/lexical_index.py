@@ -0,0 +1,152 @@
+import os
+import re
+import json
+from typing import Optional, Dict, List, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+from services.vector_index import top_k_indices
+
+load_dotenv()
+
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+
+# Compound tokens keep identifiers such as "ERR-1042", "v2.3.1" or "user_id" intact; their parts are indexed too.
+_TOKEN = re.compile(r"\w+(?:[-./:]\w+)*")
+_QUOTED = re.compile(r"\"([^\"]+)\"|“([^”]+)”")
+_IDENTIFIER = re.compile(r"^(?=.*\d)\w+(?:[-./:]\w+)*$|^\w+(?:[-./:_]\w+)+$|^[A-Z]{2,}\d*$")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./:_]", token) if part)
+    return tokens
+
+
+def is_lexical_query(query: str) -> bool:
+    # Queries made up only of quoted strings and/or at most three codes/identifiers are answered by exact term
+    # matches. A quoted phrase inside a natural-language question still needs the embedding.
+    quoted = _QUOTED.findall(query)
+    words = _QUOTED.sub(" ", query).strip().strip("?!.").split()
+    if quoted and not words:
+        return True
+    return 0 < len(words) <= 3 and all(_IDENTIFIER.match(word.strip(",;()")) for word in words)
+
+
+class LexicalIndex:
+    # Immutable BM25 index. Documents are stored doc-major (CSR of term ids and term frequencies) so files can be
+    # added or dropped without re-tokenising; term-major postings for scoring are derived from it with one argsort.
+    def __init__(self, vocab: Dict[str, int], doc_offsets: np.ndarray, doc_terms: np.ndarray, doc_tfs: np.ndarray):
+        self.vocab = vocab
+        self.doc_offsets = doc_offsets.astype(np.int64, copy=False)
+        self.doc_terms = doc_terms.astype(np.int32, copy=False)
+        self.doc_tfs = doc_tfs.astype(np.uint16, copy=False)
+        tf_totals = np.concatenate([[0], np.cumsum(self.doc_tfs, dtype=np.int64)])
+        self.doc_lengths = tf_totals[self.doc_offsets[1:]] - tf_totals[self.doc_offsets[:-1]]
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(self) else 0.0
+
+        doc_ids = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.doc_offsets))
+        order = np.argsort(self.doc_terms, kind="stable")
+        self.post_docs = doc_ids[order]
+        self.post_tfs = self.doc_tfs[order].astype(np.float32)
+        self.post_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.doc_terms, minlength=len(vocab)), out=self.post_offsets[1:])
+        self.nbytes = (
+            self.doc_offsets.nbytes + self.doc_terms.nbytes + self.doc_tfs.nbytes + self.doc_lengths.nbytes
+            + self.post_docs.nbytes + self.post_tfs.nbytes + self.post_offsets.nbytes + 48 * len(vocab)
+        )
+
+    @classmethod
+    def empty(cls) -> "LexicalIndex":
+        return cls({}, np.zeros(1, np.int64), np.zeros(0, np.int32), np.zeros(0, np.uint16))
+
+    @classmethod
+    def build(cls, texts: List[str]) -> "LexicalIndex":
+        return cls.empty().append(texts)
+
+    def __len__(self) -> int:
+        return len(self.doc_offsets) - 1
+
+    def append(self, texts: List[str]) -> "LexicalIndex":
+        vocab = dict(self.vocab)
+        offsets = [self.doc_offsets]
+        terms = [self.doc_terms]
+        tfs = [self.doc_tfs]
+        end = int(self.doc_offsets[-1])
+        new_offsets = []
+        for text in texts:
+            counts: Dict[int, int] = {}
+            for token in tokenize(text or ""):
+                term_id = vocab.setdefault(token, len(vocab))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            terms.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+            tfs.append(np.minimum(np.fromiter(counts.values(), dtype=np.int64, count=len(counts)), 65535).astype(np.uint16))
+            end += len(counts)
+            new_offsets.append(end)
+        offsets.append(np.asarray(new_offsets, dtype=np.int64))
+        return LexicalIndex(vocab, np.concatenate(offsets), np.concatenate(terms), np.concatenate(tfs))
+
+    def select(self, keep: List[int]) -> "LexicalIndex":
+        # Keeps the given documents in the given order; unused vocabulary entries stay (they have no postings).
+        keep = np.asarray(keep, dtype=np.int64)
+        starts = self.doc_offsets[keep]
+        lengths = self.doc_offsets[keep + 1] - starts
+        offsets = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return LexicalIndex(self.vocab, offsets, self.doc_terms[positions], self.doc_tfs[positions])
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        # Returns (document position, BM25 score) for documents matching at least one query term.
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        n_docs = len(self)
+        if not term_ids or n_docs == 0:
+            return []
+        scores = np.zeros(n_docs, dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term_id in term_ids:
+            start, end = self.post_offsets[term_id], self.post_offsets[term_id + 1]
+            if start == end:
+                continue
+            docs = self.post_docs[start:end]
+            tf = self.post_tfs[start:end]
+            df = end - start
+            idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm[docs])
+        matched = int(np.count_nonzero(scores))
+        if matched == 0:
+            return []
+        top = top_k_indices(scores, min(top_k, matched))
+        return [(int(i), float(scores[i])) for i in top]
+
+    def save(self, directory: str):
+        np.savez(os.path.join(directory, "lexical.npz"), doc_offsets=self.doc_offsets, doc_terms=self.doc_terms, doc_tfs=self.doc_tfs)
+        terms = [None] * len(self.vocab)
+        for term, term_id in self.vocab.items():
+            terms[term_id] = term
+        with open(os.path.join(directory, "lexical_vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["LexicalIndex"]:
+        arrays_path = os.path.join(directory, "lexical.npz")
+        vocab_path = os.path.join(directory, "lexical_vocab.json")
+        if not (os.path.exists(arrays_path) and os.path.exists(vocab_path)):
+            return None
+        with open(vocab_path, "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        with np.load(arrays_path) as arrays:
+            return cls({term: i for i, term in enumerate(terms)}, arrays["doc_offsets"], arrays["doc_terms"], arrays["doc_tfs"])
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int, top_k: int) -> List[Tuple[int, float]]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
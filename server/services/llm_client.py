@@ -0,0 +1,150 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Optional, Dict, List, AsyncIterator
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq, APIStatusError, APIConnectionError, APITimeoutError
+
+load_dotenv()
+
+LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-oss-120b")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", 5))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 16))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 0.5))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 8))
+
+_client: Optional[AsyncGroq] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_client_loop = None
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "calls": 0,
+    "errors": 0,
+    "retries": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "total_tokens": 0,
+}
+_recent_latencies_ms = deque(maxlen=500)
+
+
+def _get_client():
+    # The pooled HTTP client and semaphore belong to the event loop that created them.
+    global _client, _semaphore, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+        )
+        _client = AsyncGroq(http_client=http_client, max_retries=0)
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _client_loop = loop
+    return _client, _semaphore
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _backoff_seconds(error: Exception, attempt: int) -> float:
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX_SECONDS)
+            except ValueError:
+                pass
+    # Full jitter keeps throttled workers from retrying in lockstep.
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def _record(latency_ms: float, usage=None, error: bool = False, retries: int = 0):
+    with _metrics_lock:
+        _metrics["calls"] += 1
+        _metrics["retries"] += retries
+        if error:
+            _metrics["errors"] += 1
+        if usage is not None:
+            _metrics["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            _metrics["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            _metrics["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
+        _recent_latencies_ms.append(latency_ms)
+    tokens = getattr(usage, "total_tokens", None) if usage is not None else None
+    print(f"LLM call {'failed' if error else 'ok'} in {latency_ms:.0f} ms (retries={retries}, tokens={tokens})")
+
+
+def get_metrics() -> Dict:
+    with _metrics_lock:
+        latencies = sorted(_recent_latencies_ms)
+        snapshot = dict(_metrics)
+    if latencies:
+        snapshot["latency_ms_p50"] = latencies[len(latencies) // 2]
+        snapshot["latency_ms_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    snapshot["model"] = LLM_MODEL
+    snapshot["max_concurrency"] = LLM_MAX_CONCURRENCY
+    return snapshot
+
+
+async def complete(messages: List[Dict], **params) -> str:
+    client, semaphore = _get_client()
+    started = time.perf_counter()
+    attempt = 0
+    async with semaphore:
+        while True:
+            try:
+                completion = await client.chat.completions.create(model=LLM_MODEL, messages=messages, stream=False, **params)
+                break
+            except Exception as e:
+                if attempt >= LLM_MAX_RETRIES or not _is_retryable(e):
+                    _record((time.perf_counter() - started) * 1000, error=True, retries=attempt)
+                    raise
+                await asyncio.sleep(_backoff_seconds(e, attempt))
+                attempt += 1
+    _record((time.perf_counter() - started) * 1000, usage=completion.usage, retries=attempt)
+    return completion.choices[0].message.content.strip()
+
+
+async def stream(messages: List[Dict], **params) -> AsyncIterator[str]:
+    client, semaphore = _get_client()
+    started = time.perf_counter()
+    attempt = 0
+    usage = None
+    async with semaphore:
+        # Retries only cover opening the stream; once tokens have been sent to the caller a retry would duplicate them.
+        while True:
+            try:
+                response = await client.chat.completions.create(model=LLM_MODEL, messages=messages, stream=True, **params)
+                break
+            except Exception as e:
+                if attempt >= LLM_MAX_RETRIES or not _is_retryable(e):
+                    _record((time.perf_counter() - started) * 1000, error=True, retries=attempt)
+                    raise
+                await asyncio.sleep(_backoff_seconds(e, attempt))
+                attempt += 1
+        try:
+            async for chunk in response:
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                    usage = x_groq.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception:
+            _record((time.perf_counter() - started) * 1000, usage=usage, error=True, retries=attempt)
+            raise
+    _record((time.perf_counter() - started) * 1000, usage=usage, retries=attempt)
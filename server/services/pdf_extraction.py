@@ -0,0 +1,161 @@
+import io
+import os
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Optional, Dict, List, Tuple, Union, Iterator
+import pdfplumber
+import pytesseract
+from pdf2image import convert_from_path, convert_from_bytes
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PDF_OCR_WORKERS = int(os.getenv("PDF_OCR_WORKERS", os.cpu_count() or 1))
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", 200))
+# Consecutive image-only pages rasterised by one pdftoppm call (and OCR'd by one worker).
+PDF_OCR_BATCH_PAGES = int(os.getenv("PDF_OCR_BATCH_PAGES", 4))
+PDF_OCR_LANG = os.getenv("PDF_OCR_LANG", "eng")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PDF_OCR_WORKERS <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the server process runs threads, which fork() would copy in an inconsistent state.
+            _pool = ProcessPoolExecutor(max_workers=PDF_OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _ocr_page_range(source: Union[str, bytes], first_page: int, last_page: int, dpi: int, lang: str) -> Dict[int, str]:
+    # Runs in a worker process: one rasterisation call for the whole range, then OCR page by page.
+    try:
+        if isinstance(source, (bytes, bytearray)):
+            images = convert_from_bytes(source, dpi=dpi, first_page=first_page, last_page=last_page)
+        else:
+            images = convert_from_path(source, dpi=dpi, first_page=first_page, last_page=last_page)
+    except Exception as e:
+        print(f"Rasterising pages {first_page}-{last_page} failed: {e}")
+        return {}
+    texts = {}
+    for page_num, img in zip(range(first_page, last_page + 1), images):
+        try:
+            texts[page_num] = pytesseract.image_to_string(img, lang=lang)
+        except Exception as e:
+            print(f"OCR of page {page_num} failed: {e}")
+    return texts
+
+
+def _ocr_range_async(source: Union[str, bytes], first_page: int, last_page: int) -> Future:
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            return pool.submit(_ocr_page_range, source, first_page, last_page, PDF_OCR_DPI, PDF_OCR_LANG)
+        except Exception as e:
+            # A broken pool (worker killed, spawn unavailable) falls back to OCR in this process.
+            print(f"OCR process pool failed, continuing serially: {e}")
+            _reset_pool()
+    done: Future = Future()
+    done.set_result(_ocr_page_range(source, first_page, last_page, PDF_OCR_DPI, PDF_OCR_LANG))
+    return done
+
+
+def _range_result(source: Union[str, bytes], first_page: int, last_page: int, future: Future) -> Dict[int, str]:
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"OCR process pool failed, continuing serially: {e}")
+        _reset_pool()
+        return _ocr_page_range(source, first_page, last_page, PDF_OCR_DPI, PDF_OCR_LANG)
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def iter_pages(source: Union[str, bytes]) -> Iterator[Tuple[int, str]]:
+    # Yields (page_number, text) in page order as soon as each page is available. Text-layer pages come
+    # from a single pdfplumber pass; runs of image-only pages are OCR'd in the background meanwhile.
+    batch_pages = max(1, PDF_OCR_BATCH_PAGES)
+    pending: deque = deque()  # [page_num, text or None] in page order
+    ranges: deque = deque()  # (first, last, future) for submitted OCR ranges
+    run: List[int] = []
+    ocr_texts: Dict[int, str] = {}
+    temp_path: Optional[str] = None
+
+    def ocr_source() -> str:
+        # OCR workers get a path: in-memory PDFs are written to one temp file on the first scanned page, instead of
+        # pickling the whole document to a worker (and rasterising from a fresh copy) for every page range.
+        nonlocal temp_path
+        if not isinstance(source, (bytes, bytearray)):
+            return source
+        if temp_path is None:
+            fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+            with os.fdopen(fd, "wb") as f:
+                f.write(source)
+        return temp_path
+
+    def submit_run():
+        if run:
+            ranges.append((run[0], run[-1], _ocr_range_async(ocr_source(), run[0], run[-1])))
+            run.clear()
+
+    def collect(block: bool):
+        while ranges and (block or ranges[0][2].done()):
+            first, last, future = ranges.popleft()
+            ocr_texts.update(_range_result(ocr_source(), first, last, future))
+            for page_num in range(first, last + 1):
+                ocr_texts.setdefault(page_num, "")
+
+    def ready():
+        while pending:
+            page_num, text = pending[0]
+            if text is None:
+                if page_num not in ocr_texts:
+                    return
+                text = ocr_texts.pop(page_num)
+            pending.popleft()
+            yield page_num, text
+
+    pdf_source = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    try:
+        with pdfplumber.open(pdf_source) as pdf:
+            for page_num, page in enumerate(pdf.pages, start=1):
+                t = page.extract_text()
+                if t and t.strip():
+                    submit_run()
+                    pending.append((page_num, t))
+                else:
+                    if run and len(run) >= batch_pages:
+                        submit_run()
+                    run.append(page_num)
+                    pending.append((page_num, None))
+                collect(block=False)
+                yield from ready()
+        submit_run()
+        collect(block=True)
+        yield from ready()
+    finally:
+        if temp_path is not None:
+            # When the consumer stops early, pending ranges are cancelled; one already running just fails to read it.
+            for first, last, future in ranges:
+                future.cancel()
+            try:
+                os.remove(temp_path)
+            except OSError as e:
+                print(f"Failed to remove OCR temp file {temp_path}: {e}")
+
+
+def shutdown():
+    _reset_pool()
@@ -0,0 +1,83 @@
+import os
+import re
+import math
+from typing import Optional, List, Tuple
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+load_dotenv()
+
+# Input tokens of one RAG prompt (template, history, documents and question); the answer has its own max_tokens.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 3000))
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+
+_encoding = None
+_WORD = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+TRUNCATION_MARK = " …"
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+        except Exception as e:
+            print(f"Tokenizer {PROMPT_TOKENIZER} unavailable, using the word heuristic: {e}")
+            _encoding = False
+    return _encoding or None
+
+
+def _heuristic_pieces(text: str) -> List[Tuple[int, int]]:
+    # (end offset, tokens) per word or punctuation mark; BPE vocabularies split long words roughly every 4 chars.
+    return [(m.end(), max(1, math.ceil(len(m.group()) / 4))) for m in _WORD.finditer(text)]
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(tokens for _, tokens in _heuristic_pieces(text))
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    # Cuts at a token boundary and marks the cut, so a shortened passage is visibly shortened to the model.
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(1, max_tokens - count_tokens(TRUNCATION_MARK))
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:keep]).rstrip() + TRUNCATION_MARK
+    end, used = 0, 0
+    for piece_end, tokens in _heuristic_pieces(text):
+        if used + tokens > keep:
+            break
+        end, used = piece_end, used + tokens
+    return text[:end].rstrip() + TRUNCATION_MARK
+
+
+def take_latest(texts: List[str], budget: int, max_tokens_each: Optional[int] = None) -> List[str]:
+    # Newest items (at the end) first, each capped at max_tokens_each; stops at the first one that does not fit,
+    # so the result is always a contiguous, most recent run in the original order.
+    taken: List[str] = []
+    for text in reversed(texts):
+        if max_tokens_each is not None:
+            text = truncate(text, max_tokens_each)
+        tokens = count_tokens(text)
+        if tokens > budget:
+            break
+        taken.append(text)
+        budget -= tokens
+    taken.reverse()
+    return taken
+
+
+def tokenizer_name() -> str:
+    return PROMPT_TOKENIZER if _get_encoding() is not None else "heuristic"
@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+from services.vector_index import normalize_rows, build_vector_index
+from services.lexical_index import LexicalIndex
+
+load_dotenv()
+
+SESSION_INDEX_CACHE_MAX_BYTES = int(os.getenv("SESSION_INDEX_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+SESSION_INDEX_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_INDEX_CACHE_MAX_SESSIONS", 512))
+# Writes on other workers do not invalidate this cache; an entry older than this is re-checked against the database.
+SESSION_INDEX_CACHE_MAX_AGE_SECONDS = float(os.getenv("SESSION_INDEX_CACHE_MAX_AGE_SECONDS", 30))
+
+
+class SessionIndex:
+    # Immutable snapshot: updates build a new index so readers never see a half-applied change.
+    def __init__(self, embeddings: np.ndarray, chunks: List[Dict], normalized: bool = False, vectors=None,
+                 lexical: Optional[LexicalIndex] = None, fingerprint: Optional[Tuple[int, int]] = None,
+                 checked_at: Optional[float] = None):
+        self.embeddings = embeddings if normalized else normalize_rows(embeddings)
+        self.chunks = chunks
+        # (chunk count, highest chunk id) of the session in the database when this snapshot was taken.
+        self.fingerprint = fingerprint
+        # When the fingerprint was last confirmed against the database (time.monotonic()).
+        self.checked_at = time.monotonic() if checked_at is None else checked_at
+        self._vectors = vectors
+        self._vectors_lock = threading.Lock()
+        # BM25 index over the same rows as the embeddings; None when the chunk texts were not available.
+        self.lexical = lexical
+        # Chunk metadata only carries ids, so the matrix (and the postings arrays) dominate the footprint.
+        self.nbytes = self.embeddings.nbytes + 64 * len(chunks) + (lexical.nbytes if lexical is not None else 0)
+
+    @property
+    def vectors(self):
+        # ANN structures are built once per snapshot, on upload or on the first query after a load.
+        if self._vectors is None:
+            with self._vectors_lock:
+                if self._vectors is None:
+                    self._vectors = build_vector_index(self.embeddings)
+        return self._vectors
+
+    def search(self, query_vec: np.ndarray, top_k: int):
+        return self.vectors.search(query_vec, top_k)
+
+    def search_batch(self, query_vecs: np.ndarray, top_k: int):
+        return self.vectors.search_batch(query_vecs, top_k)
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.checked_at > SESSION_INDEX_CACHE_MAX_AGE_SECONDS
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def append(self, embeddings: np.ndarray, chunks: List[Dict], texts: Optional[List[str]] = None) -> "SessionIndex":
+        # Rows already present (a reload while the upload was still writing picked them up) are skipped.
+        known = {c["id"] for c in self.chunks}
+        keep = [i for i, c in enumerate(chunks) if c.get("id") is None or c["id"] not in known]
+        if len(keep) < len(chunks):
+            embeddings = embeddings[keep]
+            chunks = [chunks[i] for i in keep]
+            texts = [texts[i] for i in keep] if texts is not None else None
+        new_rows = normalize_rows(embeddings)
+        fingerprint = None
+        if self.fingerprint is not None:
+            count, max_id = self.fingerprint
+            fingerprint = (count + len(chunks), max([max_id] + [c["id"] for c in chunks if c.get("id") is not None]))
+        if len(self.chunks) == 0:
+            lexical = LexicalIndex.build(texts) if texts is not None else None
+            return SessionIndex(new_rows, list(chunks), normalized=True, lexical=lexical, fingerprint=fingerprint,
+                                checked_at=self.checked_at)
+        if new_rows.shape[1] != self.dim:
+            raise ValueError("Embedding dimension does not match cached session index")
+        matrix = np.concatenate([self.embeddings, new_rows], axis=0)
+        lexical = self.lexical.append(texts) if self.lexical is not None and texts is not None else None
+        return SessionIndex(matrix, self.chunks + list(chunks), normalized=True, lexical=lexical, fingerprint=fingerprint,
+                            checked_at=self.checked_at)
+
+    def without_file(self, file_id: int) -> "SessionIndex":
+        keep = [i for i, c in enumerate(self.chunks) if c.get("file_id") != file_id]
+        if len(keep) == len(self.chunks):
+            return self
+        matrix = np.ascontiguousarray(self.embeddings[keep]) if keep else self.embeddings[:0]
+        lexical = self.lexical.select(keep) if self.lexical is not None else None
+        chunks = [self.chunks[i] for i in keep]
+        fingerprint = None
+        if self.fingerprint is not None:
+            removed = len(self.chunks) - len(keep)
+            fingerprint = (self.fingerprint[0] - removed, max([c["id"] for c in chunks if c.get("id") is not None] or [0]))
+        return SessionIndex(matrix, chunks, normalized=True, lexical=lexical, fingerprint=fingerprint,
+                            checked_at=self.checked_at)
+
+
+_cache: "OrderedDict[int, SessionIndex]" = OrderedDict()
+_cache_bytes = 0
+# Bumped on every write so a loader that raced with an upload/delete does not cache a stale snapshot.
+_generations: Dict[int, int] = {}
+_file_epoch = 0
+_lock = threading.Lock()
+
+
+def _evict_locked():
+    global _cache_bytes
+    while _cache and (_cache_bytes > SESSION_INDEX_CACHE_MAX_BYTES or len(_cache) > SESSION_INDEX_CACHE_MAX_SESSIONS):
+        _, evicted = _cache.popitem(last=False)
+        _cache_bytes -= evicted.nbytes
+
+
+def _store_locked(session_id: int, index: SessionIndex):
+    global _cache_bytes
+    previous = _cache.pop(session_id, None)
+    if previous is not None:
+        _cache_bytes -= previous.nbytes
+    _cache[session_id] = index
+    _cache_bytes += index.nbytes
+    _evict_locked()
+
+
+def get(session_id: int) -> Optional[SessionIndex]:
+    # May return an expired entry; callers that serve queries re-check it with confirm() or replace it.
+    with _lock:
+        index = _cache.get(session_id)
+        if index is not None:
+            _cache.move_to_end(session_id)
+        return index
+
+
+def confirm(index: SessionIndex):
+    # The database still matches the snapshot: it stays valid for another SESSION_INDEX_CACHE_MAX_AGE_SECONDS.
+    index.checked_at = time.monotonic()
+
+
+def generation(session_id: int) -> tuple:
+    with _lock:
+        return (_file_epoch, _generations.get(session_id, 0))
+
+
+def put(session_id: int, index: SessionIndex, expected_generation: Optional[tuple] = None):
+    with _lock:
+        if expected_generation is not None and (_file_epoch, _generations.get(session_id, 0)) != expected_generation:
+            return
+        _store_locked(session_id, index)
+
+
+def invalidate(session_id: int):
+    global _cache_bytes
+    with _lock:
+        _generations[session_id] = _generations.get(session_id, 0) + 1
+        previous = _cache.pop(session_id, None)
+        if previous is not None:
+            _cache_bytes -= previous.nbytes
+
+
+def append_chunks(session_id: int, embeddings: np.ndarray, chunks: List[Dict],
+                  texts: Optional[List[str]] = None) -> Optional[SessionIndex]:
+    global _cache_bytes
+    # Only patch sessions already in memory; cold sessions are loaded in full on their next query.
+    with _lock:
+        _generations[session_id] = _generations.get(session_id, 0) + 1
+        index = _cache.get(session_id)
+        if index is None:
+            return None
+        try:
+            updated = index.append(embeddings, chunks, texts)
+        except ValueError:
+            _cache.pop(session_id, None)
+            _cache_bytes -= index.nbytes
+            return None
+        _store_locked(session_id, updated)
+        return updated
+
+
+def remove_file(file_id: int):
+    global _cache_bytes, _file_epoch
+    with _lock:
+        # The owning session of an uncached file is unknown, so every in-flight load is treated as stale.
+        _file_epoch += 1
+        for session_id, index in list(_cache.items()):
+            updated = index.without_file(file_id)
+            if updated is not index:
+                _cache[session_id] = updated
+                _cache_bytes += updated.nbytes - index.nbytes
+
+
+def stats() -> Dict:
+    with _lock:
+        return {"sessions": len(_cache), "bytes": _cache_bytes, "max_bytes": SESSION_INDEX_CACHE_MAX_BYTES,
+                "max_age_seconds": SESSION_INDEX_CACHE_MAX_AGE_SECONDS}
@@ -0,0 +1,189 @@
+import os
+import json
+import shutil
+import tempfile
+from typing import Optional, Dict, List, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+load_dotenv()
+
+# auto | exact | hnsw | ivf
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "auto").lower()
+VECTOR_INDEX_ANN_MIN_VECTORS = int(os.getenv("VECTOR_INDEX_ANN_MIN_VECTORS", 20000))
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(tempfile.gettempdir(), "docbot-index"))
+HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", 80))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_INDEX_HNSW_EF_SEARCH", 64))
+IVF_NPROBE = int(os.getenv("VECTOR_INDEX_IVF_NPROBE", 16))
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    # O(n) selection with argpartition, then a sort of only the k winners; works row-wise on (q, n) scores.
+    n = scores.shape[-1]
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        # One GEMM scores every query against every chunk.
+        similarities = queries @ self.embeddings.T
+        top = top_k_indices(similarities, top_k)
+        top_scores = np.take_along_axis(similarities, top, axis=-1)
+        return list(zip(top_scores, top))
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search_batch(query.reshape(1, -1), top_k)[0]
+
+    def save(self, path: str):
+        pass
+
+
+class FaissIndex:
+    # Inner product over L2-normalised rows is cosine similarity.
+    def __init__(self, index, kind: str):
+        self.index = index
+        self.kind = kind
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, kind: str) -> "FaissIndex":
+        dim = embeddings.shape[1]
+        if kind == "ivf":
+            nlist = max(1, min(int(4 * np.sqrt(len(embeddings))), len(embeddings) // 39))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+            index.nprobe = min(IVF_NPROBE, nlist)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        index.add(embeddings)
+        return cls(index, kind)
+
+    @classmethod
+    def load(cls, path: str, kind: str) -> "FaissIndex":
+        index = faiss.read_index(path)
+        if kind == "hnsw":
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        elif kind == "ivf":
+            index.nprobe = IVF_NPROBE
+        return cls(index, kind)
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        scores, indices = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), top_k)
+        results = []
+        for row_scores, row_indices in zip(scores, indices):
+            keep = row_indices >= 0
+            results.append((row_scores[keep], row_indices[keep]))
+        return results
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search_batch(query.reshape(1, -1), top_k)[0]
+
+    def save(self, path: str):
+        faiss.write_index(self.index, path)
+
+
+def choose_backend(num_vectors: int) -> str:
+    backend = VECTOR_INDEX_BACKEND
+    if backend == "auto":
+        backend = "hnsw" if num_vectors >= VECTOR_INDEX_ANN_MIN_VECTORS else "exact"
+    if backend in ("hnsw", "ivf") and faiss is None:
+        return "exact"
+    return backend
+
+
+def build_vector_index(embeddings: np.ndarray):
+    kind = choose_backend(len(embeddings))
+    if kind == "exact" or len(embeddings) == 0:
+        return ExactIndex(embeddings)
+    return FaissIndex.build(embeddings, kind)
+
+
+def _session_dir(session_id: int) -> str:
+    return os.path.join(VECTOR_INDEX_DIR, f"session_{session_id}")
+
+
+def save_session_index(session_id: int, embeddings: np.ndarray, chunks: List[Dict], vectors, lexical=None,
+                       fingerprint: Optional[Tuple[int, int]] = None) -> bool:
+    tmp_dir = None
+    try:
+        os.makedirs(VECTOR_INDEX_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f"session_{session_id}_", dir=VECTOR_INDEX_DIR)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), embeddings)
+        with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump({"kind": vectors.kind, "chunks": chunks, "fingerprint": fingerprint}, f, default=str)
+        if vectors.kind != "exact":
+            vectors.save(os.path.join(tmp_dir, "index.faiss"))
+        if lexical is not None:
+            lexical.save(tmp_dir)
+        target = _session_dir(session_id)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+        return True
+    except Exception as e:
+        print(f"Failed to persist vector index for session {session_id}: {e}")
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+
+
+def load_session_index(session_id: int, fingerprint: Optional[Tuple[int, int]] = None
+                       ) -> Optional[Tuple[np.ndarray, List[Dict], object, object]]:
+    # fingerprint: the session's current chunk fingerprint; an index saved for other chunks (written by another
+    # instance, or before a restart) is dropped so the caller rebuilds it from the database.
+    from services.lexical_index import LexicalIndex  # imported here: lexical_index depends on this module
+    target = _session_dir(session_id)
+    if not os.path.isdir(target):
+        return None
+    try:
+        with open(os.path.join(target, "chunks.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        stored = meta.get("fingerprint")
+        if fingerprint is not None and (stored is None or tuple(stored) != tuple(fingerprint)):
+            delete_session_index(session_id)
+            return None
+        embeddings = np.load(os.path.join(target, "vectors.npy"))
+        kind = meta.get("kind", "exact")
+        vectors = None
+        if kind != "exact" and faiss is not None and choose_backend(len(embeddings)) == kind:
+            vectors = FaissIndex.load(os.path.join(target, "index.faiss"), kind)
+        lexical = LexicalIndex.load(target)
+        return embeddings, meta["chunks"], vectors, lexical
+    except Exception as e:
+        print(f"Failed to load vector index for session {session_id}: {e}")
+        delete_session_index(session_id)
+        return None
+
+
+def delete_session_index(session_id: int):
+    shutil.rmtree(_session_dir(session_id), ignore_errors=True)